@@ -0,0 +1,257 @@
+"""
+Streaming import/export of forums with their message trees.
+
+JSONL archives start with a {"type": "forum", ...} line followed by one
+{"type": "message", ...} line per message in thread order (parents before
+replies). CSV archives hold messages only, with the MESSAGE_FIELDS columns.
+Users are referenced by email, messages by their id in the archive.
+"""
+import csv
+import json
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .caching import bump_version
+from .counters import recompute_counters
+from .mentions import create_mentions_bulk, forget_name
+from .models import Category, Forum, Message, Tag
+from .search import MESSAGE, get_backend, message_document
+from .tree import MAX_DEPTH, PATH_STEP, path_segment
+
+MESSAGE_FIELDS = ['id', 'parent', 'user', 'content', 'created_at', 'updated_at']
+
+
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def forum_header(forum):
+    return {
+        'type': 'forum',
+        'id': forum.pk,
+        'name': forum.name,
+        'description': forum.description,
+        'category': forum.category.name if forum.category else None,
+        'tags': list(forum.tags.values_list('name', flat=True)),
+        'created_by': forum.created_by.email,
+        'is_locked': forum.is_locked,
+        'created_at': isoformat(forum.created_at),
+    }
+
+
+def message_rows(forum, chunk_size=2000):
+    """
+    Yields the forum's messages in thread order without loading them all
+    """
+    rows = (
+        Message.objects.filter(forum=forum).order_by('path')
+        .values_list('id', 'parent_id', 'user__email', 'content', 'created_at', 'updated_at')
+        .iterator(chunk_size=chunk_size)
+    )
+    for pk, parent_id, email, content, created_at, updated_at in rows:
+        yield {
+            'type': 'message',
+            'id': pk,
+            'parent': parent_id,
+            'user': email,
+            'content': content,
+            'created_at': isoformat(created_at),
+            'updated_at': isoformat(updated_at),
+        }
+
+
+def write_jsonl(forum, stream, chunk_size=2000):
+    count = 0
+    stream.write(json.dumps(forum_header(forum)) + '\n')
+    for row in message_rows(forum, chunk_size):
+        stream.write(json.dumps(row) + '\n')
+        count += 1
+    return count
+
+
+def write_csv(forum, stream, chunk_size=2000):
+    count = 0
+    writer = csv.DictWriter(stream, fieldnames=MESSAGE_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for row in message_rows(forum, chunk_size):
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def read_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        row['type'] = 'message'
+        row['id'] = int(row['id'])
+        row['parent'] = int(row['parent']) if row.get('parent') else None
+        yield row
+
+
+def create_forum(header, user_ids):
+    """
+    Creates the forum described by a JSONL header line
+    """
+    category = None
+    if header.get('category'):
+        category, _ = Category.objects.get_or_create(name=header['category'])
+    forum = Forum.objects.create(
+        name=header['name'],
+        description=header.get('description', ''),
+        category=category,
+        created_by_id=user_ids[header['created_by']],
+        is_locked=header.get('is_locked', False),
+    )
+    tags = [Tag.objects.get_or_create(name=name)[0] for name in header.get('tags', [])]
+    forum.tags.set(tags)
+    return forum
+
+
+class Importer:
+    """
+    Writes messages in chunks, each in its own transaction, with one bulk
+    insert, one bulk update for thread paths and timestamps, one mention
+    lookup/insert and one search index write per thread level in the chunk.
+
+    Only archive id -> message id is kept between chunks, so replies can
+    find their parent however far apart they are in the file; the paths of
+    parents from earlier chunks are read back per chunk, for the parents
+    that chunk refers to.
+    """
+
+    def __init__(self, forum=None, batch_size=1000, create_users=False, progress=None):
+        self.forum = forum
+        self.batch_size = batch_size
+        self.create_users = create_users
+        self.progress = progress
+        self.ids = {}
+        self.users = {}
+        self.imported = 0
+        self.mentions = 0
+        self.skipped = 0
+        self.started = time.monotonic()
+
+    @property
+    def rate(self):
+        return self.imported / max(time.monotonic() - self.started, 1e-9)
+
+    def run(self, rows):
+        rows = iter(rows)
+        if self.forum is None:
+            header = next(rows, None)
+            if header is None or header.get('type') != 'forum':
+                raise ValueError('Archive has no forum header; pass an existing forum instead')
+            self.resolve_users([header['created_by']])
+            with transaction.atomic():
+                self.forum = create_forum(header, self.users)
+
+        while True:
+            chunk = [row for row in islice(rows, self.batch_size) if row.get('type', 'message') == 'message']
+            if not chunk:
+                break
+            self.write_chunk(chunk)
+            if self.progress:
+                self.progress(self)
+
+        recompute_counters(Forum.objects.filter(pk=self.forum.pk))
+        bump_version('forums')
+        return self.forum
+
+    def resolve_users(self, emails):
+        User = get_user_model()
+        missing = [email for email in set(emails) if email not in self.users]
+        if not missing:
+            return
+        self.users.update(User.objects.filter(email__in=missing).values_list('email', 'id'))
+        if self.create_users:
+            new = [
+                User(email=email, name=email.split('@')[0], password=make_password(None))
+                for email in missing if email not in self.users
+            ]
+            # bulk_create skips the signals that keep these caches fresh
+            for user in User.objects.bulk_create(new):
+                self.users[user.email] = user.pk
+                forget_name(user.name)
+            if new:
+                bump_version('users')
+
+    def write_chunk(self, chunk):
+        self.resolve_users([row['user'] for row in chunk])
+        chunk_ids = {row['id'] for row in chunk}
+        paths = self.parent_paths(chunk, chunk_ids)
+
+        with transaction.atomic():
+            # Replies can only be inserted once their parent has an id, so a
+            # chunk is written in waves: roots and replies to earlier chunks
+            # first, then replies to those, and so on
+            while chunk:
+                ready, waiting = [], []
+                for row in chunk:
+                    parent = row.get('parent')
+                    if parent is None or parent in paths:
+                        ready.append(row)
+                    elif parent in chunk_ids:
+                        waiting.append(row)
+                    else:
+                        self.skipped += 1
+                if not ready:
+                    self.skipped += len(waiting)
+                    break
+                self.insert(ready, paths)
+                chunk_ids.difference_update(row['id'] for row in ready)
+                chunk = waiting
+
+    def parent_paths(self, chunk, chunk_ids):
+        """
+        {archive id: thread path} for the parents outside the chunk that
+        were imported
+        """
+        parents = {row['parent'] for row in chunk if row.get('parent') is not None} - chunk_ids
+        archive_ids = {self.ids[parent]: parent for parent in parents if parent in self.ids}
+        if not archive_ids:
+            return {}
+        rows = Message.objects.filter(pk__in=archive_ids).values_list('id', 'path')
+        return {archive_ids[pk]: path for pk, path in rows}
+
+    def insert(self, rows, paths):
+        pending = []
+        for row in rows:
+            parent_path = paths.get(row['parent'], '')
+            user_id = self.users.get(row['user'])
+            # Messages by unknown users and too-deep replies are skipped, and
+            # with them their replies, whose parent never gets a path
+            if user_id is None or len(parent_path) // PATH_STEP > MAX_DEPTH:
+                self.skipped += 1
+                continue
+            message = Message(forum=self.forum, user_id=user_id, content=row['content'])
+            message.parent_id = int(parent_path[-PATH_STEP:], 36) if parent_path else None
+            pending.append((row, parent_path, message))
+
+        if not pending:
+            return
+
+        messages = [message for _, _, message in pending]
+        Message.objects.bulk_create(messages)
+        for row, parent_path, message in pending:
+            message.path = parent_path + path_segment(message.pk)
+            message.depth = len(message.path) // PATH_STEP - 1
+            # bulk_create applies auto_now(_add); keep the archive's times
+            message.created_at = parse_datetime(row.get('created_at') or '') or message.created_at
+            message.updated_at = parse_datetime(row.get('updated_at') or '') or message.created_at
+            paths[row['id']] = message.path
+            self.ids[row['id']] = message.pk
+        Message.objects.bulk_update(messages, ['path', 'depth', 'created_at', 'updated_at'])
+        self.mentions += create_mentions_bulk(messages)
+        get_backend().index_many(MESSAGE, [(message.pk, message_document(message)) for message in messages])
+        self.imported += len(messages)
@@ -0,0 +1,114 @@
+"""
+Native async routes for the read-heavy api endpoints, used instead of the
+regular ones when settings.API_ASYNC_VIEWS is on (ASGI deployments turn it
+on in mysite/asgi.py).
+
+Under ASGI every sync view is run in a worker thread. These routes set the
+DRF view up as usual (authentication, content negotiation, permissions;
+in a thread when a credential is sent, since checking it may load the
+user), then await its async handler (aget, alist, aretrieve), which reads through
+the async ORM and cache and renders with api.fastpath. Anything else, i.e.
+writes, ?stream=, the browsable API or serializers the fast path can't
+render, goes to the regular view, so responses are the same either way.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.urls import path, re_path
+from rest_framework.response import Response
+
+from . import views
+from .fastpath import Unsupported, enabled
+from .streaming import stream_format
+
+
+def plain_response(response):
+    """
+    Renders a DRF response into a plain HttpResponse, which Django won't
+    hand to a thread to render
+    """
+    response.render()
+    plain = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        plain[header] = value
+    plain.cookies = response.cookies
+    return plain
+
+
+def can_serve(view, request):
+    if request.accepted_renderer.format != 'json' or stream_format(request) or not enabled():
+        return False
+    try:
+        view.get_plan()
+    except Unsupported:
+        return False
+    return True
+
+
+def async_route(view_class, handler, actions=None, **initkwargs):
+    """
+    Returns an async view running view_class's handler for GET requests,
+    and the regular view (actions as for ViewSet.as_view) for the rest
+    """
+    if actions:
+        fallback = sync_to_async(view_class.as_view(actions, **initkwargs))
+    else:
+        fallback = sync_to_async(view_class.as_view(**initkwargs))
+
+    async def view(request, *args, **kwargs):
+        if request.method != 'GET':
+            return await fallback(request, *args, **kwargs)
+
+        # What APIView.dispatch does, around an awaited handler
+        self = view_class(**initkwargs)
+        if actions:
+            self.action_map = actions
+        self.args, self.kwargs = args, kwargs
+        drf_request = self.initialize_request(request, *args, **kwargs)
+        self.request = drf_request
+        self.headers = self.default_response_headers
+        try:
+            if request.META.get('HTTP_AUTHORIZATION'):
+                # Authenticating a credential may load the user (a sync ORM
+                # query), so it runs in a thread; anonymous requests don't
+                await sync_to_async(self.initial)(drf_request, *args, **kwargs)
+            else:
+                self.initial(drf_request, *args, **kwargs)
+            if not can_serve(self, drf_request):
+                return await fallback(request, *args, **kwargs)
+            response = await getattr(self, handler)(drf_request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        response = self.finalize_response(drf_request, response, *args, **kwargs)
+        if isinstance(response, Response):
+            response = plain_response(response)
+        return response
+
+    view.view_class = view_class
+    return view
+
+
+category_list = async_route(views.CategoryList, 'aget')
+tag_list = async_route(views.TagList, 'aget')
+forum_list = async_route(
+    views.ForumViewSet, 'alist', {'get': 'list', 'post': 'create'},
+    basename='forums', detail=False, suffix='List',
+)
+forum_detail = async_route(
+    views.ForumViewSet, 'aretrieve',
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'},
+    basename='forums', detail=True, suffix='Instance',
+)
+message_list = async_route(
+    views.MessageViewSet, 'alist', {'get': 'list', 'post': 'create'},
+    basename='messages', detail=False, suffix='List',
+)
+
+# Matched ahead of the router's routes for the same paths
+urlpatterns = [
+    path('categories', category_list),
+    path('tags', tag_list),
+    path('forums/', forum_list, name='forums-list'),
+    # Numeric ids only, so /forums/facets/ goes on to the router
+    re_path(r'^forums/(?P<pk>\d+)/$', forum_detail, name='forums-detail'),
+    path('messages/', message_list, name='messages-list'),
+]
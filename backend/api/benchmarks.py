@@ -0,0 +1,210 @@
+"""
+Repeatable per-endpoint benchmarks (see the benchmark_api command).
+
+The cases are requests against whatever is in the database, normally data
+made with seed_forum_data. micro() sends each one a number of times
+in-process through the test client and records latency percentiles and
+query counts; load() sends each GET case to a running server with
+api.loadtest for requests per second under concurrency. Results can be
+saved as a JSON baseline, and compare() flags what got slower since.
+"""
+import json
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from myauth.tokens import ForumRefreshToken
+from . import loadtest
+from .models import Forum, Message
+from .seeding import PASSWORD
+from .tree import PATH_STEP
+
+# Response cache entries turned off while benchmarking, so the views run
+CACHED_ENDPOINTS = ('categories', 'tags', 'forums')
+
+# Latency changes smaller than this are noise, whatever the percentage
+MIN_DELTA_MS = 0.5
+
+
+class Case:
+
+    def __init__(self, name, path, method='GET', data=None, authenticated=True, emails=()):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data
+        self.authenticated = authenticated
+        # Logins rotate through these (and through client addresses), so
+        # the login throttles don't kick in
+        self.emails = list(emails)
+
+    def send(self, client, number, headers):
+        extra = headers if self.authenticated else {}
+        if self.method == 'GET':
+            return client.get(self.path, **extra)
+        data = dict(self.data or {})
+        if self.emails:
+            data['email'] = self.emails[number % len(self.emails)]
+        address = f'10.{number // 65536 % 256}.{number // 256 % 256}.{number % 256}'
+        return client.generic(self.method, self.path, data=json.dumps(data), content_type='application/json',
+                              REMOTE_ADDR=address, **extra)
+
+
+def pick_user(prefix):
+    """
+    The seeded user mentioned most often (so the mentions case has rows),
+    or any user
+    """
+    User = get_user_model()
+    users = User.objects.filter(email__startswith=f'{prefix}-user-')
+    if not users.exists():
+        users = User.objects.all()
+    return users.annotate(mentions=Count('mentioned_in')).order_by('-mentions', 'id').first()
+
+
+def build_cases(prefix='seed'):
+    """
+    Returns (user, cases) for the busiest forum in the database
+    """
+    user = pick_user(prefix)
+    forum = Forum.objects.filter(is_deleted=False).order_by('-message_count', 'id').first()
+    if user is None or forum is None:
+        raise ValueError('No users or forums to benchmark; run seed_forum_data first')
+
+    cases = [
+        Case('forums', '/api/forums/'),
+        Case('forums_most_active', '/api/forums/?ordering=most_active'),
+        Case('forum_detail', f'/api/forums/{forum.pk}/'),
+    ]
+    if forum.category_id:
+        cases.append(Case('forums_by_category', f'/api/forums/?category_id={forum.category_id}'))
+    tag_ids = list(forum.tags.values_list('id', flat=True)[:2])
+    if tag_ids:
+        tags_query = '&'.join(f'tags_id={tag_id}' for tag_id in tag_ids)
+        cases += [
+            Case('forums_by_tags', f'/api/forums/?{tags_query}'),
+            Case('forums_facets', f'/api/forums/facets/?{tags_query}'),
+        ]
+
+    cases += [
+        Case('messages_by_forum', f'/api/messages/?forum_id={forum.pk}'),
+        Case('messages_by_forum_cursor', f'/api/messages/?forum_id={forum.pk}&pagination=cursor'),
+    ]
+    deepest = Message.objects.filter(forum=forum).order_by('-depth', 'id').values_list('path', flat=True).first()
+    if deepest:
+        cases.append(Case('thread', f'/api/messages/{int(deepest[:PATH_STEP], 36)}/thread/'))
+
+    emails = get_user_model().objects.filter(email__startswith=f'{prefix}-user-').values_list('email', flat=True)
+    cases += [
+        Case('mentions', '/api/message-mentions/'),
+        Case('unread', '/api/forum-memberships/unread/'),
+        Case('notifications', '/api/notifications/'),
+        Case('search', '/api/search/?q=latency'),
+        Case('login', '/auth/login', method='POST', data={'password': PASSWORD}, authenticated=False,
+             emails=list(emails.order_by('id')[:1000]) or [user.email]),
+    ]
+    return user, cases
+
+
+def auth_headers(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {ForumRefreshToken.for_user(user).access_token}'}
+
+
+def summary(timings):
+    timings = sorted(timings)
+    return {
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'p50_ms': round(loadtest.percentile(timings, 0.50) * 1000, 3),
+        'p95_ms': round(loadtest.percentile(timings, 0.95) * 1000, 3),
+        'p99_ms': round(loadtest.percentile(timings, 0.99) * 1000, 3),
+    }
+
+
+def micro(cases, user, iterations=20, warmup=2, cache=False):
+    """
+    Runs every case iterations times in-process. Returns {name: {'method',
+    'path', 'status', 'queries', 'iterations', 'mean_ms', 'p50_ms',
+    'p95_ms', 'p99_ms'}}; queries are counted on one extra run.
+    """
+    client = Client()
+    headers = auth_headers(user)
+    ttls = {} if cache else {'API_CACHE_TTLS': {endpoint: 0 for endpoint in CACHED_ENDPOINTS}}
+    results = {}
+    number = 0
+    with override_settings(**ttls):
+        for case in cases:
+            for _ in range(warmup):
+                case.send(client, number, headers)
+                number += 1
+            timings = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                response = case.send(client, number, headers)
+                timings.append(time.perf_counter() - started)
+                number += 1
+            with CaptureQueriesContext(connection) as captured:
+                case.send(client, number, headers)
+                number += 1
+            results[case.name] = {
+                'method': case.method,
+                'path': case.path,
+                'status': response.status_code,
+                'queries': len(captured),
+                'iterations': iterations,
+                **summary(timings),
+            }
+    return results
+
+
+def load(base_url, cases, user, concurrency=16, duration=5.0, token=None):
+    """
+    Loads each GET case on its own for duration seconds. Returns {name:
+    {'path', 'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms'}}.
+    """
+    token = token or str(ForumRefreshToken.for_user(user).access_token)
+    headers = {'Authorization': f'Bearer {token}'}
+    results = {}
+    for case in cases:
+        if case.method != 'GET':
+            continue
+        result = loadtest.run(base_url, [case.path], concurrency=concurrency, duration=duration, headers=headers)
+        results[case.name] = {
+            'path': case.path,
+            **{key: result[key] for key in ('requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms')},
+        }
+    return results
+
+
+def compare(baseline, results, tolerance=0.25, timings=True):
+    """
+    Returns {name: [what regressed]} for cases in both: p50/p95 latency or
+    throughput worse by more than tolerance (a fraction), more queries, or
+    another status. Without timings only the counts are compared, which
+    holds across machines.
+    """
+    regressions = {}
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        found = []
+        for key in ('p50_ms', 'p95_ms') if timings else ():
+            old, new = before.get(key), result.get(key)
+            if old is not None and new is not None and new > old * (1 + tolerance) and new - old >= MIN_DELTA_MS:
+                found.append(f'{key} {old:g} -> {new:g} (+{(new / old - 1) * 100 if old else 100:.0f}%)')
+        if 'queries' in before and result.get('queries', 0) > before['queries']:
+            found.append(f"queries {before['queries']} -> {result['queries']}")
+        if timings and 'rps' in before and before['rps'] and result.get('rps', 0) < before['rps'] * (1 - tolerance):
+            found.append(f"rps {before['rps']:g} -> {result['rps']:g} ({(result['rps'] / before['rps'] - 1) * 100:.0f}%)")
+        if 'status' in before and result.get('status') != before['status']:
+            found.append(f"status {before['status']} -> {result.get('status')}")
+        if result.get('errors', 0) > before.get('errors', 0):
+            found.append(f"errors {before.get('errors', 0)} -> {result['errors']}")
+        if found:
+            regressions[name] = found
+    return regressions
@@ -0,0 +1,178 @@
+import functools
+import hashlib
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+KEY_PREFIX = 'api-cache'
+
+# Per-process hit/miss counters, by endpoint
+stats = {}
+stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def get_ttl(endpoint):
+    return getattr(settings, 'API_CACHE_TTLS', {}).get(endpoint, 60)
+
+
+def version_key(namespace):
+    return f'{KEY_PREFIX}:version:{namespace}'
+
+
+def new_version():
+    return int(time.time() * 1000)
+
+
+def get_versions(namespaces):
+    """
+    Current version of each namespace. Bumping a version orphans every
+    cached response that depended on it, without having to find them.
+    """
+    cache = get_cache()
+    keys = [version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    # Versions start from the clock, so a version key that was evicted can't
+    # come back with a number older entries were stored under
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(namespaces):
+    cache = get_cache()
+    keys = [version_key(namespace) for namespace in namespaces]
+    versions = await cache.aget_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        await cache.aset_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_version(namespace):
+    cache = get_cache()
+    key = version_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, new_version(), None)
+
+
+def record(endpoint, outcome):
+    with stats_lock:
+        counters = stats.setdefault(endpoint, {'hit': 0, 'miss': 0, 'not_modified': 0})
+        counters[outcome] += 1
+
+
+def cache_stats():
+    """
+    Snapshot of {endpoint: {'hit': n, 'miss': n, 'not_modified': n}}
+    """
+    with stats_lock:
+        return {endpoint: dict(counters) for endpoint, counters in stats.items()}
+
+
+def response_key(endpoint, versions, request):
+    params = sorted(
+        (name, value) for name in request.query_params for value in request.query_params.getlist(name)
+    )
+    raw = repr((request.get_host(), request.path, params, versions))
+    return f'{KEY_PREFIX}:{endpoint}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return etag in tags or '*' in tags
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+    return since is not None and int(last_modified) <= since
+
+
+def with_validators(response, etag, last_modified, outcome):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['X-Cache'] = outcome.upper()
+    return response
+
+
+def cache_response(endpoint, depends_on):
+    """
+    Caches the data of a GET handler under a key made of the endpoint, the
+    request's query parameters and the versions of the depends_on
+    namespaces, for the endpoint's TTL in settings.API_CACHE_TTLS.
+
+    Responses carry ETag/Last-Modified and conditional requests get a 304.
+    Works on sync and async handlers.
+    """
+    def cached(request, entry):
+        data, etag, last_modified = entry
+        if not_modified(request, etag, last_modified):
+            record(endpoint, 'not_modified')
+            return with_validators(Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified, 'hit')
+        record(endpoint, 'hit')
+        return with_validators(Response(data), etag, last_modified, 'hit')
+
+    def entry_for(key, response):
+        """
+        Returns what to cache for a fresh response, or None to leave it out
+        """
+        # Streamed responses have no data to keep
+        if response.status_code != status.HTTP_200_OK or response.streaming:
+            return None
+        # Keep the view's own validator if it has one, so clients see the
+        # same ETag whether or not the response came from the cache
+        etag = response.get('ETag') or quote_etag(key.rsplit(':', 1)[1])
+        return response.data, etag, time.time()
+
+    def decorator(method):
+        if iscoroutinefunction(method):
+            # The same for async handlers (see api.asyncviews)
+            @functools.wraps(method)
+            async def async_wrapper(self, request, *args, **kwargs):
+                key = response_key(endpoint, await aget_versions(depends_on), request)
+                cache = get_cache()
+
+                entry = await cache.aget(key)
+                if entry is not None:
+                    return cached(request, entry)
+
+                record(endpoint, 'miss')
+                response = await method(self, request, *args, **kwargs)
+                entry = entry_for(key, response)
+                if entry is None:
+                    return response
+                await cache.aset(key, entry, get_ttl(endpoint))
+                return with_validators(response, entry[1], entry[2], 'miss')
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            key = response_key(endpoint, get_versions(depends_on), request)
+            cache = get_cache()
+
+            entry = cache.get(key)
+            if entry is not None:
+                return cached(request, entry)
+
+            record(endpoint, 'miss')
+            response = method(self, request, *args, **kwargs)
+            entry = entry_for(key, response)
+            if entry is None:
+                return response
+            cache.set(key, entry, get_ttl(endpoint))
+            return with_validators(response, entry[1], entry[2], 'miss')
+        return wrapper
+    return decorator
@@ -0,0 +1,143 @@
+import hashlib
+
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .caching import aget_versions, get_versions
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified support for viewset list and retrieve routes.
+
+    A paginated list is validated by the rows its page is read from (the
+    primary key, etag_max_fields and etag_sum_fields of each, plus the row
+    count when the response shows one), read with the same indexed range
+    scan as the page, so a 304 costs neither serialization nor a pass over
+    the whole filtered queryset. Unpaginated lists, which read every row
+    anyway, use one aggregate query (row count, max primary key, max
+    etag_max_fields, sum of etag_sum_fields) and a detail its row. Related
+    data rendered by the serializer is covered by the api.caching versions
+    of etag_namespaces. alist/aretrieve do the same for the async routes.
+    """
+    etag_max_fields = ('updated_at',)
+    etag_sum_fields = ()
+    etag_namespaces = ()
+    last_modified_field = 'updated_at'
+
+    def make_etag(self, request, state, versions):
+        raw = repr((state, request.get_full_path(), request.accepted_renderer.format, versions))
+        return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+    def get_etag(self, request, state):
+        versions = get_versions(self.etag_namespaces) if self.etag_namespaces else None
+        return self.make_etag(request, state, versions)
+
+    async def aget_etag(self, request, state):
+        versions = await aget_versions(self.etag_namespaces) if self.etag_namespaces else None
+        return self.make_etag(request, state, versions)
+
+    def state_aggregates(self):
+        aggregates = {'count': Count('pk'), 'max_pk': Max('pk')}
+        for field in self.etag_max_fields:
+            aggregates[f'max_{field}'] = Max(field)
+        for field in self.etag_sum_fields:
+            aggregates[f'sum_{field}'] = Sum(field)
+        return aggregates
+
+    def state_fields(self):
+        return list(dict.fromkeys(('pk',) + self.etag_max_fields + self.etag_sum_fields))
+
+    def list_window(self, queryset):
+        """
+        (paginator, (rows of the page, ?count= mode)), with None for the
+        window when the paginator can't tell which rows the page reads
+        """
+        paginator = self.pagination_class() if self.pagination_class is not None else None
+        if not hasattr(paginator, 'state_window'):
+            return paginator, None
+        return paginator, paginator.state_window(queryset.values_list(*self.state_fields()), self.request)
+
+    def list_state(self):
+        queryset = self.get_queryset()
+        paginator, window = self.list_window(queryset)
+        if window is None:
+            state = queryset.order_by().aggregate(**self.state_aggregates())
+            return sorted(state.items()), state.get(f'max_{self.last_modified_field}')
+        rows, count_mode = window
+        return (list(rows), paginator.count_rows(queryset, count_mode)), None
+
+    async def alist_state(self):
+        queryset = self.get_queryset()
+        paginator, window = self.list_window(queryset)
+        if window is None:
+            state = await queryset.order_by().aaggregate(**self.state_aggregates())
+            return sorted(state.items()), state.get(f'max_{self.last_modified_field}')
+        rows, count_mode = window
+        return ([row async for row in rows], await paginator.acount_rows(queryset, count_mode)), None
+
+    def detail_queryset(self):
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.get_queryset().order_by().filter(**{self.lookup_field: lookup}).values(*self.state_fields())
+
+    def detail_state(self):
+        row = self.detail_queryset().first()
+        if row is None:
+            return None, None
+        return sorted(row.items()), row.get(self.last_modified_field)
+
+    async def adetail_state(self):
+        row = await self.detail_queryset().afirst()
+        if row is None:
+            return None, None
+        return sorted(row.items()), row.get(self.last_modified_field)
+
+    def validate(self, request, etag, last_modified):
+        """
+        Returns (304 response or None, Last-Modified timestamp)
+        """
+        timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+        return get_conditional_response(request, etag=etag, last_modified=timestamp), timestamp
+
+    def with_validators(self, response, etag, timestamp):
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def conditional(self, request, handler, state, last_modified, *args, **kwargs):
+        etag = self.get_etag(request, state)
+        not_modified, timestamp = self.validate(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return self.with_validators(handler(request, *args, **kwargs), etag, timestamp)
+
+    async def aconditional(self, request, handler, state, last_modified, *args, **kwargs):
+        etag = await self.aget_etag(request, state)
+        not_modified, timestamp = self.validate(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return self.with_validators(await handler(request, *args, **kwargs), etag, timestamp)
+
+    def list(self, request, *args, **kwargs):
+        state, _ = self.list_state()
+        # Deletes don't move a max timestamp, so lists only validate by ETag
+        return self.conditional(request, super().list, state, None, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        state, last_modified = self.detail_state()
+        if state is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional(request, super().retrieve, state, last_modified, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        state, _ = await self.alist_state()
+        return await self.aconditional(request, super().alist, state, None, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        state, last_modified = await self.adetail_state()
+        if state is None:
+            return await super().aretrieve(request, *args, **kwargs)
+        return await self.aconditional(request, super().aretrieve, state, last_modified, *args, **kwargs)
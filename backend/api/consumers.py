@@ -0,0 +1,118 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import ForumMembership
+from .realtime import forum_group, get_broker, user_group
+
+# Close codes in the 4000-4999 range reserved for applications
+CLOSE_UNAUTHORIZED = 4401
+
+
+def authenticate(scope):
+    """
+    Returns the user id from the ?token=<access token> query parameter, or
+    None. Browsers can't set headers on WebSocket requests, hence the query
+    string.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode())
+    token = (query.get('token') or [None])[0]
+    if not token:
+        return None
+    try:
+        return AccessToken(token)[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+
+
+async def member_forum_ids(user_id):
+    queryset = ForumMembership.objects.filter(user_id=user_id).values_list('forum_id', flat=True)
+    return {forum_id async for forum_id in queryset}
+
+
+class EventsConsumer:
+    """
+    ASGI WebSocket endpoint pushing message.created/updated/deleted events
+    for every forum the user is a member of, plus mention.created events
+    for the user.
+
+    Clients can send {"action": "subscribe" | "unsubscribe", "forum_id": N}
+    to follow forums they join or leave while connected, and
+    {"action": "ping"} to get a pong.
+    """
+
+    def __init__(self, broker=None):
+        self.broker = broker
+
+    async def __call__(self, scope, receive, send):
+        message = await receive()
+        if message['type'] != 'websocket.connect':
+            return
+
+        user_id = authenticate(scope)
+        if user_id is None:
+            await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+            return
+
+        broker = self.broker or get_broker()
+        forums = await member_forum_ids(user_id)
+        subscription = await broker.subscribe(
+            [user_group(user_id)] + [forum_group(forum_id) for forum_id in forums]
+        )
+        await send({'type': 'websocket.accept'})
+
+        incoming = asyncio.ensure_future(receive())
+        outgoing = asyncio.ensure_future(subscription.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait({incoming, outgoing}, return_when=asyncio.FIRST_COMPLETED)
+                if outgoing in done:
+                    await self.send_json(send, outgoing.result())
+                    outgoing = asyncio.ensure_future(subscription.get())
+                if incoming in done:
+                    message = incoming.result()
+                    if message['type'] == 'websocket.disconnect':
+                        break
+                    if message['type'] == 'websocket.receive':
+                        await self.handle(message, user_id, subscription, send)
+                    incoming = asyncio.ensure_future(receive())
+        finally:
+            incoming.cancel()
+            outgoing.cancel()
+            await subscription.close()
+
+    async def handle(self, message, user_id, subscription, send):
+        try:
+            command = json.loads(message.get('text') or message.get('bytes') or '')
+            action = command['action']
+        except (ValueError, TypeError, KeyError):
+            await self.send_json(send, {'type': 'error', 'detail': 'Expected JSON with an action'})
+            return
+
+        if action == 'ping':
+            await self.send_json(send, {'type': 'pong'})
+        elif action in ('subscribe', 'unsubscribe'):
+            try:
+                forum_id = int(command.get('forum_id'))
+            except (TypeError, ValueError):
+                await self.send_json(send, {'type': 'error', 'detail': 'forum_id must be an integer'})
+                return
+            if action == 'subscribe':
+                # Checked on every subscribe so users only follow forums they joined
+                if forum_id not in await member_forum_ids(user_id):
+                    await self.send_json(send, {'type': 'error', 'detail': 'Not a member of this forum'})
+                    return
+                await subscription.add(forum_group(forum_id))
+            else:
+                await subscription.discard(forum_group(forum_id))
+            await self.send_json(send, {'type': f'{action}d', 'forum_id': forum_id})
+        else:
+            await self.send_json(send, {'type': 'error', 'detail': f'Unknown action {action!r}'})
+
+    async def send_json(self, send, data):
+        await send({'type': 'websocket.send', 'text': json.dumps(data, cls=DjangoJSONEncoder)})
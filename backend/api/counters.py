@@ -0,0 +1,48 @@
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def change_member_count(forum_id, delta):
+    from .models import Forum
+    Forum.objects.filter(pk=forum_id).update(member_count=F('member_count') + delta)
+
+
+def change_message_count(forum_id, delta, posted_at=None):
+    """
+    Adjusts a forum's message count, and its last activity when a message
+    was posted at posted_at
+    """
+    from .models import Forum
+    changes = {'message_count': F('message_count') + delta}
+    if posted_at is not None:
+        changes['last_activity_at'] = Greatest(F('last_activity_at'), Value(posted_at))
+    Forum.objects.filter(pk=forum_id).update(**changes)
+
+
+def count_subquery(queryset, field='forum'):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(field)
+            .annotate(total=Count('*')).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def recompute_counters(forums):
+    """
+    Recomputes member_count, message_count and last_activity_at for a
+    queryset of forums with a single UPDATE. Returns the number of forums.
+    """
+    from .models import ForumMembership, Message
+
+    last_post = Subquery(
+        Message.objects.filter(forum=OuterRef('pk')).order_by().values('forum')
+        .annotate(last=Max('created_at')).values('last')
+    )
+    return forums.update(
+        member_count=count_subquery(ForumMembership.objects.all()),
+        message_count=count_subquery(Message.objects.all()),
+        last_activity_at=Coalesce(last_post, F('created_at')),
+    )
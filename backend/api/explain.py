@@ -0,0 +1,64 @@
+import json
+from contextlib import contextmanager
+
+
+@contextmanager
+def capture_queries(connection):
+    """
+    Collects the (sql, params) of every query run on connection, unlike
+    CaptureQueriesContext which only keeps the interpolated SQL
+    """
+    queries = []
+
+    def wrapper(execute, sql, params, many, context):
+        if not many:
+            queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield queries
+
+
+def explain(connection, sql, params):
+    """
+    Returns the plan of a SELECT as a list of lines
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return list(postgres_nodes(plan[0]['Plan']))
+        raise NotImplementedError(f'EXPLAIN is not supported for {connection.vendor}')
+
+
+def postgres_nodes(node, depth=0):
+    relation = f" on {node['Relation Name']}" if 'Relation Name' in node else ''
+    index = f" using {node['Index Name']}" if 'Index Name' in node else ''
+    yield '  ' * depth + node['Node Type'] + relation + index
+    for child in node.get('Plans', []):
+        yield from postgres_nodes(child, depth + 1)
+
+
+def sequential_scans(plan, allowed=()):
+    """
+    Returns the tables read without an index, other than those in allowed
+    """
+    tables = []
+    # Subqueries SQLite evaluates on their own, whose rows it then scans
+    derived = set()
+    for line in plan:
+        words = line.split()
+        if words[:1] in (['CO-ROUTINE'], ['MATERIALIZE']) and len(words) > 1:
+            derived.add(words[1])
+        elif words[:1] == ['SCAN'] and len(words) > 1 and words[1] not in derived:
+            # SQLite: "SCAN table" without "USING ... INDEX" reads every row
+            if 'INDEX' not in words and 'VIRTUAL' not in words:
+                tables.append(words[1])
+        elif 'Seq Scan on' in line:
+            tables.append(line.split('Seq Scan on ', 1)[1].split()[0])
+    return [table for table in tables if table not in allowed]
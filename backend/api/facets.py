@@ -0,0 +1,306 @@
+"""
+Facet index for browsing forums by category and tag.
+
+ForumFacet rows hold, for every category and tag, the set of live forums
+in it as a bitmap of forum ids (plus one row with all live forums). The
+signals in api.signals keep them up to date as forums are saved, deleted
+or retagged; rebuild() (`manage.py rebuild_forum_facets`) recreates them.
+
+Each process keeps the bitmaps in memory as Python ints, reloaded when the
+revision on the all-forums row moves. Every write moves it in the same
+transaction, so one indexed lookup per request sees writes from any
+process. Filtering by any number of tags is then an AND/OR of a few ints,
+and the count for every category and tag an AND plus a popcount, whatever
+the number of forum/tag links.
+"""
+import operator
+import secrets
+import threading
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Q
+
+ALL_KEY = ('all', 0)
+
+
+def from_ids(ids):
+    """
+    Bitmap (an int) with the bits of ids set
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    data = bytearray(max(ids) // 8 + 1)
+    for forum_id in ids:
+        data[forum_id >> 3] |= 1 << (forum_id & 7)
+    return int.from_bytes(data, 'little')
+
+
+def to_ids(bitmap):
+    """
+    The ids set in bitmap, in increasing order
+    """
+    ids = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for index, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            ids.append(index * 8 + low.bit_length() - 1)
+            byte ^= low
+    return ids
+
+
+def to_bytes(bitmap):
+    return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+
+
+def from_bytes(data):
+    return int.from_bytes(bytes(data or b''), 'little')
+
+
+def apply(additions=(), removals=()):
+    """
+    Sets and clears forum bits; both are iterables of ((kind, value_id),
+    forum_id). Each bitmap touched is read and written once, locked for
+    the transaction where the database supports it.
+    """
+    from .models import ForumFacet
+
+    changes = {}
+    for key, forum_id in additions:
+        changes.setdefault(key, (set(), set()))[0].add(forum_id)
+    for key, forum_id in removals:
+        changes.setdefault(key, (set(), set()))[1].add(forum_id)
+    if not changes:
+        return
+
+    with transaction.atomic():
+        ForumFacet.objects.bulk_create(
+            [ForumFacet(kind=kind, value_id=value_id) for kind, value_id in changes],
+            ignore_conflicts=True,
+        )
+        keys = reduce(operator.or_, (Q(kind=kind, value_id=value_id) for kind, value_id in changes))
+        rows = ForumFacet.objects.select_for_update().filter(keys)
+        for row in rows:
+            added, removed = changes[(row.kind, row.value_id)]
+            before = from_bytes(row.bitmap)
+            bitmap = (before | from_ids(added)) & ~from_ids(removed)
+            if bitmap == before and row.forum_count == bitmap.bit_count():
+                continue
+            row.bitmap = to_bytes(bitmap)
+            row.forum_count = bitmap.bit_count()
+            row.save(update_fields=['bitmap', 'forum_count'])
+        touch()
+
+
+def new_revision():
+    # Random rather than a counter, so a write that was rolled back (after
+    # some process loaded it) can't leave a revision a later write reuses
+    return secrets.randbits(62) + 1
+
+
+def touch():
+    """
+    Moves the revision processes compare their copy of the bitmaps with
+    """
+    from .models import ForumFacet
+
+    kind, value_id = ALL_KEY
+    revision = new_revision()
+    if not ForumFacet.objects.filter(kind=kind, value_id=value_id).update(revision=revision):
+        ForumFacet.objects.bulk_create([ForumFacet(kind=kind, value_id=value_id, revision=revision)], ignore_conflicts=True)
+
+
+def forum_keys(category_id, tag_ids):
+    keys = [ALL_KEY] + [('tag', tag_id) for tag_id in tag_ids]
+    if category_id is not None:
+        keys.append(('category', category_id))
+    return keys
+
+
+def tag_ids(forum_id):
+    from .models import Forum
+    return list(Forum.tags.through.objects.filter(forum_id=forum_id).values_list('tag_id', flat=True))
+
+
+def forum_saved(forum, created):
+    """
+    post_save: moves the forum between categories, or in or out of the
+    index when it was (un)deleted
+    """
+    loaded = (None, True) if created else getattr(forum, '_loaded_facets', None)
+    if loaded is None:
+        reindex_forum(forum.pk)
+    else:
+        old_category, old_deleted = loaded
+        if old_deleted != forum.is_deleted:
+            keys = forum_keys(old_category if forum.is_deleted else forum.category_id, [] if created else tag_ids(forum.pk))
+            if forum.is_deleted:
+                apply(removals=[(key, forum.pk) for key in keys])
+            else:
+                apply(additions=[(key, forum.pk) for key in keys])
+        elif not forum.is_deleted and old_category != forum.category_id:
+            apply(
+                additions=[(('category', forum.category_id), forum.pk)] if forum.category_id is not None else [],
+                removals=[(('category', old_category), forum.pk)] if old_category is not None else [],
+            )
+    forum._loaded_facets = (forum.category_id, forum.is_deleted)
+
+
+def forum_deleted(forum_id):
+    """
+    post_delete: clears the forum from every bitmap
+    """
+    from .models import ForumFacet
+
+    keys = ForumFacet.objects.values_list('kind', 'value_id')
+    apply(removals=[(key, forum_id) for key in keys])
+
+
+def reindex_forum(forum_id):
+    """
+    Clears forum_id from every bitmap and sets it where it belongs now
+    """
+    from .models import Forum, ForumFacet
+
+    forum = Forum.objects.filter(pk=forum_id).values('category_id', 'is_deleted').first()
+    wanted = set()
+    if forum is not None and not forum['is_deleted']:
+        wanted = set(forum_keys(forum['category_id'], tag_ids(forum_id)))
+    existing = ForumFacet.objects.values_list('kind', 'value_id')
+    apply(
+        additions=[(key, forum_id) for key in wanted],
+        removals=[(key, forum_id) for key in existing if key not in wanted],
+    )
+
+
+def tags_changed(instance, action, reverse, pk_set):
+    """
+    m2m_changed for Forum.tags, from either side
+    """
+    from .models import Forum
+
+    if action == 'pre_clear':
+        # What is about to go, for post_clear
+        if reverse:
+            instance._cleared_forum_ids = list(instance.forums.values_list('id', flat=True))
+        else:
+            instance._cleared_tag_ids = tag_ids(instance.pk)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        forum_ids = getattr(instance, '_cleared_forum_ids', []) if action == 'post_clear' else pk_set
+        live = Forum.objects.filter(pk__in=forum_ids, is_deleted=False).values_list('id', flat=True)
+        links = [(('tag', instance.pk), forum_id) for forum_id in live]
+    else:
+        if instance.is_deleted:
+            return
+        ids = getattr(instance, '_cleared_tag_ids', []) if action == 'post_clear' else pk_set
+        links = [(('tag', tag_id), instance.pk) for tag_id in ids]
+    if action == 'post_add':
+        apply(additions=links)
+    else:
+        apply(removals=links)
+
+
+def drop(kind, value_id):
+    """
+    post_delete of a category or tag
+    """
+    from .models import ForumFacet
+
+    with transaction.atomic():
+        ForumFacet.objects.filter(kind=kind, value_id=value_id).delete()
+        touch()
+
+
+def rebuild():
+    """
+    Recreates every bitmap from the forums and their tags. Returns the
+    number of bitmaps.
+    """
+    from .models import Forum, ForumFacet
+
+    members = {}
+    for forum_id, category_id in Forum.objects.filter(is_deleted=False).values_list('id', 'category_id').iterator():
+        members.setdefault(ALL_KEY, []).append(forum_id)
+        if category_id is not None:
+            members.setdefault(('category', category_id), []).append(forum_id)
+    links = Forum.tags.through.objects.filter(forum__is_deleted=False).values_list('tag_id', 'forum_id')
+    for tag_id, forum_id in links.iterator():
+        members.setdefault(('tag', tag_id), []).append(forum_id)
+
+    # The all-forums row carries the revision, so it's there even when empty
+    members.setdefault(ALL_KEY, [])
+    rows = []
+    for (kind, value_id), ids in members.items():
+        bitmap = from_ids(ids)
+        rows.append(ForumFacet(
+            kind=kind, value_id=value_id, bitmap=to_bytes(bitmap), forum_count=bitmap.bit_count(),
+            revision=new_revision() if (kind, value_id) == ALL_KEY else 0,
+        ))
+    with transaction.atomic():
+        ForumFacet.objects.all().delete()
+        ForumFacet.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+# This process's copy of the bitmaps, with the revision it was loaded at
+loaded = {'revision': None, 'bitmaps': {}}
+loaded_lock = threading.Lock()
+
+
+def bitmaps():
+    """
+    {(kind, value_id): bitmap} for every facet
+    """
+    from .models import ForumFacet
+
+    kind, value_id = ALL_KEY
+    revision = ForumFacet.objects.filter(kind=kind, value_id=value_id).values_list('revision', flat=True).first()
+    with loaded_lock:
+        if loaded['revision'] != revision:
+            maps = {}
+            for kind, value_id, data, row_revision in ForumFacet.objects.values_list(
+                'kind', 'value_id', 'bitmap', 'revision',
+            ):
+                maps[(kind, value_id)] = from_bytes(data)
+                if (kind, value_id) == ALL_KEY:
+                    # What was read, in case a write landed in between
+                    revision = row_revision
+            loaded['bitmaps'] = maps
+            loaded['revision'] = revision
+        return loaded['bitmaps']
+
+
+def counts(category_id=None, tag_ids=(), match_all=False, within=None):
+    """
+    Facet counts for the forums matching the filters: returns (total,
+    {category_id: count}, {tag_id: count}). Tag counts are within the
+    current result; category counts ignore the category filter (a forum
+    has one category, so they show the alternatives). within is an
+    optional bitmap of forums the other filters allow.
+    """
+    maps = bitmaps()
+    matching = maps.get(ALL_KEY, 0)
+    if tag_ids:
+        tagged = [maps.get(('tag', tag_id), 0) for tag_id in tag_ids]
+        matching &= reduce(operator.and_ if match_all else operator.or_, tagged)
+    if within is not None:
+        matching &= within
+    result = matching & maps.get(('category', category_id), 0) if category_id is not None else matching
+
+    categories, tags = {}, {}
+    for (kind, value_id), bitmap in maps.items():
+        if kind == 'category':
+            count = (bitmap & matching).bit_count()
+            if count:
+                categories[value_id] = count
+        elif kind == 'tag':
+            count = (bitmap & result).bit_count()
+            if count:
+                tags[value_id] = count
+    return result.bit_count(), categories, tags
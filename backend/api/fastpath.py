@@ -0,0 +1,279 @@
+"""
+Read-only rendering straight from .values() rows.
+
+ValuesPlan compiles a DRF serializer (after ?fields= trimming) into the
+.values() columns it reads and a small converter per field, then turns the
+rows into the same dicts serializer.data would produce, without building
+model instances or going through each field's get_attribute. Forward
+nested serializers become joined columns, forward many-to-many nested
+serializers one extra query for the whole page.
+
+Serializers using anything else (method fields, dotted sources, custom
+to_representation, ...) raise Unsupported and are rendered normally.
+"""
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F
+from django.http import Http404
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from . import metrics
+
+# Fields whose database value is already what the serializer would output
+PASSTHROUGH = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.PrimaryKeyRelatedField,
+    serializers.ReadOnlyField,
+)
+
+
+class Unsupported(Exception):
+    pass
+
+
+def enabled():
+    return getattr(settings, 'API_FAST_SERIALIZERS', True)
+
+
+def datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != 'iso-8601':
+        return field.to_representation
+    tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+
+    def convert(value):
+        if tz is not None:
+            value = value.astimezone(tz)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def converter(field):
+    """
+    Returns a function turning a non-null column value into the field's
+    output, or None when the value can be used as it is
+    """
+    if isinstance(field, serializers.DateTimeField):
+        return datetime_converter(field)
+    if isinstance(field, PASSTHROUGH) and not isinstance(field, serializers.ChoiceField):
+        return None
+    return field.to_representation
+
+
+def readable_fields(serializer):
+    # TimedMixin only times the regular to_representation
+    plain = (serializers.Serializer.to_representation, metrics.TimedMixin.to_representation)
+    if type(serializer).to_representation not in plain:
+        raise Unsupported(f'{type(serializer).__name__} overrides to_representation')
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source == '*' or '.' in field.source:
+            raise Unsupported(f'{name} has source {field.source!r}')
+        if isinstance(field, (serializers.SerializerMethodField, serializers.HyperlinkedRelatedField)):
+            raise Unsupported(f'{name} is a {type(field).__name__}')
+        yield name, field
+
+
+def compile_fields(serializer, model, prefix=''):
+    """
+    Returns (columns, entries, many) where entries are
+    (name, kind, key, extra) tuples in output order
+    """
+    columns, entries, many = [], [], []
+    for name, field in readable_fields(serializer):
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            model_field = None
+
+        if isinstance(field, serializers.ListSerializer):
+            if model_field is None or not model_field.many_to_many or model_field.auto_created or prefix:
+                raise Unsupported(f'{name} is not a forward many-to-many relation')
+            child_columns, child_entries, child_many = compile_fields(field.child, model_field.related_model)
+            if child_many or any(kind == 'nested' for _, kind, _, _ in child_entries):
+                raise Unsupported(f'{name} nests too deep')
+            entries.append((name, 'many', model_field, (child_columns, child_entries)))
+            many.append(name)
+        elif isinstance(field, serializers.BaseSerializer):
+            if model_field is None or not (model_field.many_to_one or model_field.one_to_one) or model_field.auto_created:
+                raise Unsupported(f'{name} is not a forward relation')
+            key = prefix + model_field.attname
+            child_columns, child_entries, child_many = compile_fields(
+                field, model_field.related_model, prefix + field.source + '__'
+            )
+            if child_many:
+                raise Unsupported(f'{name} nests a many relation')
+            columns.append(key)
+            columns.extend(child_columns)
+            entries.append((name, 'nested', key, child_entries))
+        elif isinstance(field, serializers.RelatedField):
+            if model_field is None or not model_field.many_to_one:
+                raise Unsupported(f'{name} is not a forward key')
+            key = prefix + model_field.attname
+            columns.append(key)
+            entries.append((name, 'value', key, None))
+        else:
+            key = prefix + (model_field.attname if model_field is not None else field.source)
+            if model_field is None and prefix:
+                raise Unsupported(f'{name} is not a model field')
+            columns.append(key)
+            entries.append((name, 'value', key, converter(field)))
+    return columns, entries, many
+
+
+def build(row, entries):
+    data = {}
+    for name, kind, key, extra in entries:
+        if kind == 'many':
+            # Filled in by ValuesPlan.render
+            data[name] = []
+            continue
+        value = row[key]
+        if kind == 'nested':
+            data[name] = None if value is None else build(row, extra)
+        elif value is None or extra is None:
+            data[name] = value
+        else:
+            data[name] = extra(value)
+    return data
+
+
+class ValuesPlan:
+    """
+    serializer.data for a queryset, built from .values() rows
+    """
+
+    def __init__(self, serializer, queryset):
+        if isinstance(serializer, serializers.ListSerializer):
+            serializer = serializer.child
+        self.model = queryset.model
+        self.columns, self.entries, self.many = compile_fields(serializer, self.model)
+
+        known = set(queryset.query.annotations)
+        for field in self.model._meta.concrete_fields:
+            known.update((field.name, field.attname))
+        for column in self.columns:
+            if '__' not in column and column not in known:
+                raise Unsupported(f'{column} is neither a column nor an annotation')
+
+        # Ordering columns are fetched too, for keyset cursors
+        ordering = [
+            item.lstrip('-') for item in queryset.query.order_by
+            if isinstance(item, str) and '__' not in item and item != '?'
+        ]
+        self.pk_name = self.model._meta.pk.attname
+        self.fetch = list(dict.fromkeys(self.columns + ordering + [self.pk_name]))
+
+    def values(self, queryset):
+        return queryset.select_related(None).prefetch_related(None).values(*self.fetch)
+
+    def related(self, rows):
+        """
+        Yields (name, row ids, queryset) for each many relation, the same
+        query prefetch_related runs
+        """
+        ids = list(dict.fromkeys(row[self.pk_name] for row in rows))
+        for name, kind, model_field, child in self.entries:
+            if kind != 'many':
+                continue
+            child_columns, child_entries = child
+            owner = model_field.related_query_name()
+            queryset = model_field.related_model._default_manager.filter(
+                **{f'{owner}__in': ids}
+            ).values(*child_columns, _owner=F(owner))
+            yield name, child_entries, queryset
+
+    def attach(self, data, rows, name, child_entries, related):
+        by_id = {}
+        for item, row in zip(data, rows):
+            by_id.setdefault(row[self.pk_name], []).append(item)
+        for row in related:
+            child = build(row, child_entries)
+            for item in by_id[row['_owner']]:
+                item[name].append(child)
+
+    def render(self, rows):
+        rows = list(rows)
+        return metrics.timed('serialize', self.build, rows)
+
+    def build(self, rows):
+        data = [build(row, self.entries) for row in rows]
+        if self.many and rows:
+            for name, child_entries, queryset in self.related(rows):
+                self.attach(data, rows, name, child_entries, queryset)
+        return data
+
+    async def arender(self, rows):
+        """
+        render for rows already fetched, querying many relations with the
+        async ORM
+        """
+        with metrics.timer('serialize'):
+            data = [build(row, self.entries) for row in rows]
+            if self.many and rows:
+                for name, child_entries, queryset in self.related(rows):
+                    self.attach(data, rows, name, child_entries, [row async for row in queryset])
+        return data
+
+
+class FastListMixin:
+    """
+    Renders list responses with a ValuesPlan when the view's serializer
+    allows it (and settings.API_FAST_SERIALIZERS is on), falling back to
+    the regular serializer otherwise. The output is the same either way.
+
+    alist/aretrieve always use the plan, with the async ORM; see
+    api.asyncviews for when they are used.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not enabled():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            plan = ValuesPlan(self.get_serializer(), queryset)
+        except Unsupported:
+            return super().list(request, *args, **kwargs)
+
+        rows = plan.values(queryset)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        return Response(plan.render(rows))
+
+    def get_plan(self):
+        """
+        The ValuesPlan for this request; raises Unsupported
+        """
+        return ValuesPlan(self.get_serializer(), self.filter_queryset(self.get_queryset()))
+
+    async def alist(self, request, *args, **kwargs):
+        # Async routes only get here for views get_plan() supports
+        queryset = self.filter_queryset(self.get_queryset())
+        plan = ValuesPlan(self.get_serializer(), queryset)
+        rows = plan.values(queryset)
+        page = await self.paginator.apaginate_queryset(rows, request, view=self) if self.paginator else None
+        if page is not None:
+            return self.get_paginated_response(await plan.arender(page))
+        return Response(await plan.arender([row async for row in rows]))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        plan = ValuesPlan(self.get_serializer(), queryset)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            rows = [row async for row in plan.values(queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}))]
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        if not rows:
+            # Same message as get_object_or_404
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        return Response((await plan.arender(rows[:1]))[0])
@@ -0,0 +1,190 @@
+"""
+A small database-backed job queue for side effects of writes.
+
+Tasks are functions registered with @task. enqueue() stores a Job row once
+the current transaction commits, and `manage.py run_jobs` workers claim
+ready jobs in batches, run them and delete them. Failed jobs are retried
+with exponential backoff until max_attempts, then kept as failed.
+
+Jobs carry plain JSON payloads (ids, not instances) and read the current
+state of the database when they run, so a job with the same idempotency
+key as one still pending is simply dropped: the pending one will see the
+latest data anyway.
+
+With settings.API_JOBS_EAGER, enqueue() runs the task right away instead.
+It defaults to eager while the realtime broker is in-process: jobs run by
+a worker publish their events in the worker, out of reach of the
+websockets of the web processes.
+"""
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+class Task:
+
+    def __init__(self, function, name, batch, max_attempts):
+        self.function = function
+        self.name = name
+        self.batch = batch
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.function(*args, **kwargs)
+
+    def run(self, payloads):
+        if self.batch:
+            self.function(payloads)
+        else:
+            for payload in payloads:
+                self.function(**payload)
+
+
+def task(name=None, batch=False, max_attempts=5):
+    """
+    Registers a task. A regular task is called with its payload as keyword
+    arguments; a batch task once with the list of payloads claimed together.
+    """
+    def decorator(function):
+        task = Task(function, name or f'{function.__module__}.{function.__name__}', batch, max_attempts)
+        registry[task.name] = task
+        return task
+    return decorator
+
+
+def eager():
+    value = getattr(settings, 'API_JOBS_EAGER', None)
+    if value is None:
+        from .realtime import get_broker
+        return not getattr(get_broker(), 'shared', True)
+    return value
+
+
+def enqueue(task, payload=None, key=None, delay=0):
+    """
+    Queues task(**payload) after the current transaction commits (right away
+    outside of one). Nothing is queued while a job with the same key is
+    still pending.
+    """
+    payload = payload or {}
+    if eager():
+        task.run([payload])
+        return
+
+    def insert():
+        from .models import Job
+        Job.objects.bulk_create([Job(
+            name=task.name,
+            payload=payload,
+            key=key,
+            max_attempts=task.max_attempts,
+            run_at=timezone.now() + timedelta(seconds=delay),
+        )], ignore_conflicts=True)
+
+    transaction.on_commit(insert)
+
+
+def backoff(attempts):
+    """
+    Seconds before the next try after attempts failed ones
+    """
+    base = getattr(settings, 'API_JOBS_RETRY_DELAY', 5)
+    return min(base * 2 ** (attempts - 1), getattr(settings, 'API_JOBS_MAX_RETRY_DELAY', 3600))
+
+
+def claim(limit, lease):
+    """
+    Marks up to limit ready jobs as running for lease seconds and returns
+    them. Jobs whose lease ran out (a worker died) are ready again.
+    """
+    from .models import Job
+
+    now = timezone.now()
+    ready = Q(status=Job.PENDING, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now)
+    with transaction.atomic():
+        queryset = Job.objects.filter(ready).order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent workers take different jobs instead of waiting
+            queryset = queryset.select_for_update(skip_locked=True)
+        jobs = list(queryset[:limit])
+        if jobs:
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=Job.RUNNING, locked_until=now + timedelta(seconds=lease),
+            )
+    return jobs
+
+
+def run_jobs(limit=100, lease=300):
+    """
+    Claims and runs one batch of jobs. Returns (done, failed), jobs
+    dropped for a newer copy counting as done.
+    """
+    from .models import Job
+
+    jobs = claim(limit, lease)
+    by_name = {}
+    for job in jobs:
+        by_name.setdefault(job.name, []).append(job)
+
+    succeeded, failed = [], []
+    for name, group in by_name.items():
+        task = registry.get(name)
+        runs = [group] if task is not None and task.batch else [[job] for job in group]
+        for run in runs:
+            try:
+                if task is None:
+                    raise LookupError(f'No task named {name!r}')
+                task.run([job.payload for job in run])
+            except Exception:
+                error = traceback.format_exc()
+                logger.warning('Job %s failed', name, exc_info=True)
+                failed += [(job, error) for job in run]
+            else:
+                succeeded += run
+
+    # A job queued again while this one ran already covers the retry
+    keys = [job.key for job, _ in failed if job.key]
+    requeued = set(Job.objects.filter(status=Job.PENDING, key__in=keys).values_list('key', flat=True)) if keys else set()
+    succeeded += [job for job, _ in failed if job.key in requeued]
+    failed = [(job, error) for job, error in failed if job.key not in requeued]
+
+    Job.objects.filter(pk__in=[job.pk for job in succeeded]).delete()
+    now = timezone.now()
+    for job, error in failed:
+        job.attempts += 1
+        job.last_error = error
+        job.locked_until = None
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+        else:
+            job.status = Job.PENDING
+            job.run_at = now + timedelta(seconds=backoff(job.attempts))
+    Job.objects.bulk_update([job for job, _ in failed], ['attempts', 'last_error', 'locked_until', 'status', 'run_at'])
+    return len(succeeded), len(failed)
+
+
+def work(limit=100, lease=300, poll_interval=1.0, stop=lambda: False, once=False):
+    """
+    Runs jobs until stop() is true, sleeping poll_interval when there are
+    none. Returns the totals (succeeded, failed).
+    """
+    totals = [0, 0]
+    while not stop():
+        succeeded, failed = run_jobs(limit, lease)
+        totals[0] += succeeded
+        totals[1] += failed
+        if once and not succeeded + failed:
+            break
+        if not succeeded + failed:
+            time.sleep(poll_interval)
+    return tuple(totals)
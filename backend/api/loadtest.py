@@ -0,0 +1,109 @@
+"""
+A small closed-loop HTTP load generator, to compare deployments of the api
+(see the loadtest command).
+
+Each client thread keeps one keep-alive connection and sends its next
+request as soon as the previous one is answered, cycling through the
+paths. Only the standard library is used, so it runs anywhere the
+backend does; for very high rates run it from another machine.
+"""
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of sorted values
+    """
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+def connect(url, timeout):
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    return connection_class(parts.hostname, parts.port, timeout=timeout)
+
+
+def run(base_url, paths, concurrency=16, duration=10.0, requests=None, headers=None, timeout=30.0):
+    """
+    Sends requests to base_url + each path from concurrency clients for
+    duration seconds, or until requests have been sent in total. Returns
+    {'requests', 'errors', 'seconds', 'rps', 'p50_ms', 'p90_ms', 'p95_ms',
+    'p99_ms', 'max_ms', 'bytes', 'statuses'}; responses with a status of 400 or more
+    and failed connections count as errors.
+    """
+    base_path = urlsplit(base_url).path.rstrip('/')
+    headers = {'Accept': 'application/json', **(headers or {})}
+    lock = threading.Lock()
+    remaining = [requests]
+    latencies, statuses = [], {}
+    totals = {'errors': 0, 'bytes': 0}
+
+    def take():
+        with lock:
+            if remaining[0] is None:
+                return True
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def client(offset, deadline):
+        connection = connect(base_url, timeout)
+        own_latencies, own_statuses, errors, received = [], {}, 0, 0
+        index = offset
+        while time.monotonic() < deadline and take():
+            target = base_path + paths[index % len(paths)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                connection.request('GET', target, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                connection.close()
+                connection = connect(base_url, timeout)
+                continue
+            own_latencies.append(time.perf_counter() - started)
+            own_statuses[response.status] = own_statuses.get(response.status, 0) + 1
+            received += len(body)
+            if response.status >= 400:
+                errors += 1
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            for code, count in own_statuses.items():
+                statuses[code] = statuses.get(code, 0) + count
+            totals['errors'] += errors
+            totals['bytes'] += received
+
+    started = time.monotonic()
+    deadline = started + duration
+    threads = [threading.Thread(target=client, args=(number, deadline)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.monotonic() - started
+
+    latencies.sort()
+    milliseconds = lambda value: round(value * 1000, 2) if value is not None else None  # noqa: E731
+    return {
+        'requests': len(latencies),
+        'errors': totals['errors'],
+        'seconds': round(seconds, 3),
+        'rps': round(len(latencies) / seconds, 1) if seconds else 0.0,
+        'p50_ms': milliseconds(percentile(latencies, 0.50)),
+        'p90_ms': milliseconds(percentile(latencies, 0.90)),
+        'p95_ms': milliseconds(percentile(latencies, 0.95)),
+        'p99_ms': milliseconds(percentile(latencies, 0.99)),
+        'max_ms': milliseconds(latencies[-1] if latencies else None),
+        'bytes': totals['bytes'],
+        'statuses': dict(sorted(statuses.items())),
+    }
@@ -0,0 +1,103 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the main endpoints (forum list and filters, messages by forum, threads, mentions, '
+        'unread counts, search, login) on the data in the database, e.g. from seed_forum_data. '
+        'micro mode runs them in-process and reports latency percentiles and query counts; load mode '
+        'reports requests per second against a running server. Compare with a saved --baseline to '
+        'flag regressions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['micro', 'load'], default='micro')
+        parser.add_argument('--case', action='append', default=[], help='Only run this case (repeatable)')
+        parser.add_argument('--prefix', default='seed', help='Prefix given to seed_forum_data, to pick the user')
+        parser.add_argument('--iterations', type=int, default=20, help='Requests per case in micro mode')
+        parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per case in micro mode')
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Keep the response cache on in micro mode (by default the views always run)')
+        parser.add_argument('--url', help='Base URL of the server to load in load mode')
+        parser.add_argument('--token', help='Access token for load mode, if the server has other keys')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per case in load mode')
+        parser.add_argument('--baseline', help='Compare with the results saved in this file')
+        parser.add_argument('--save-baseline', metavar='PATH', help='Save the results to this file')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Slowdown (as a fraction) tolerated before a case is flagged')
+        parser.add_argument('--ignore-timings', action='store_true',
+                            help='Only compare query counts, statuses and errors, e.g. with a baseline from another '
+                                 'machine such as the committed benchmarks/baseline.json')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error when a case is flagged')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        mode = options['mode']
+        if mode == 'load' and not options['url']:
+            raise CommandError('load mode needs --url')
+        baseline = self.read_baseline(options['baseline'], mode) if options['baseline'] else None
+
+        try:
+            user, cases = benchmarks.build_cases(options['prefix'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if options['case']:
+            unknown = set(options['case']) - {case.name for case in cases}
+            if unknown:
+                raise CommandError(f"Unknown cases: {', '.join(sorted(unknown))}")
+            cases = [case for case in cases if case.name in options['case']]
+
+        if mode == 'micro':
+            results = benchmarks.micro(
+                cases, user, iterations=options['iterations'], warmup=options['warmup'], cache=options['with_cache'],
+            )
+        else:
+            results = benchmarks.load(
+                options['url'], cases, user,
+                concurrency=options['concurrency'], duration=options['duration'], token=options['token'],
+            )
+        regressions = benchmarks.compare(
+            baseline, results, options['tolerance'], timings=not options['ignore_timings'],
+        ) if baseline else {}
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w', encoding='utf-8') as stream:
+                json.dump({'mode': mode, 'created_at': timezone.now().isoformat(), 'cases': results}, stream, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'mode': mode, 'cases': results, 'regressions': regressions}, indent=2))
+        else:
+            self.report(mode, results, regressions)
+
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} cases regressed')
+
+    def read_baseline(self, path, mode):
+        try:
+            with open(path, encoding='utf-8') as stream:
+                baseline = json.load(stream)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read the baseline {path}: {exc}')
+        if baseline.get('mode') != mode:
+            raise CommandError(f"The baseline is for {baseline.get('mode')} mode, not {mode}")
+        return baseline['cases']
+
+    def report(self, mode, results, regressions):
+        last = 'queries' if mode == 'micro' else 'req/s'
+        self.stdout.write(f"{'case':<26} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {last:>8}")
+        for name, result in results.items():
+            value = result['queries'] if mode == 'micro' else f"{result['rps']:.0f}"
+            self.stdout.write(
+                f"{name:<26} {result['p50_ms'] or 0:>8.2f} {result['p95_ms'] or 0:>8.2f} "
+                f"{result['p99_ms'] or 0:>8.2f} {value:>8}"
+            )
+        for name, found in regressions.items():
+            self.stderr.write(self.style.ERROR(f"REGRESSION {name}: {'; '.join(found)}"))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions') if results else 'No cases run')
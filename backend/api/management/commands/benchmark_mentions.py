@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from api.mentions import CACHE_PREFIX
+from api.models import Category, Forum, Message
+
+
+class Command(BaseCommand):
+    help = (
+        'Counts the queries Message.save() issues for messages with a growing number of @mentions, '
+        'with the mentions job run inline. All writes are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[0, 1, 5, 20, 100],
+            help='Mention counts to benchmark',
+        )
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        User = get_user_model()
+
+        self.stdout.write(f"{'mentions':>8} {'create (cold)':>14} {'create (warm)':>14} {'re-save':>8} {'edit':>6}")
+        with override_settings(API_JOBS_EAGER=True), transaction.atomic():
+            author = User.objects.create_user(email='bench-author@example.com', password=None, name='bench_author')
+            forum = Forum.objects.create(
+                name='Mention benchmark',
+                category=Category.objects.create(name='bench-mentions'),
+                created_by=author,
+            )
+            users = User.objects.bulk_create([
+                User(email=f'bench-{i}@example.com', name=f'bench_user_{i}')
+                for i in range(max(sizes))
+            ])
+
+            for size in sizes:
+                names = [user.name for user in users[:size]]
+                content = ' '.join(f'@{name}' for name in names)
+                cache.delete_many([CACHE_PREFIX + name for name in names])
+
+                cold = self.count(lambda: Message.objects.create(forum=forum, user=author, content=content))
+                warm = self.count(lambda: Message.objects.create(forum=forum, user=author, content=content))
+
+                message = Message.objects.get(pk=Message.objects.latest('id').pk)
+                resave = self.count(message.save)
+
+                message.content = ' '.join(f'@{name}' for name in names[size // 2:]) + ' @nobody'
+                edit = self.count(message.save)
+
+                self.stdout.write(f'{size:>8} {cold:>14} {warm:>14} {resave:>8} {edit:>6}')
+
+            transaction.set_rollback(True)
+
+    def count(self, func):
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+        return len(ctx.captured_queries)
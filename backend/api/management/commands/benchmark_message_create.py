@@ -0,0 +1,72 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from api import jobs
+from api.models import Category, Forum, Job, Message
+
+
+class Command(BaseCommand):
+    help = (
+        'Times Message.objects.create() for replies with @mentions, with the side effects run inline '
+        '(API_JOBS_EAGER) and queued as jobs, then how long a worker takes to run the queued ones. '
+        'Commit callbacks are run after each create as a commit would. All writes are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help='Messages created per mode')
+        parser.add_argument('--mentions', type=int, default=5, help='@mentions per message')
+        parser.add_argument('--batch-size', type=int, default=100, help='Jobs claimed at a time by the worker')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        self.stdout.write(f"{'mode':<8} {'mean ms':>8} {'p50 ms':>8} {'p90 ms':>8} {'worker ms':>10} {'jobs':>6}")
+        with transaction.atomic():
+            author = User.objects.create_user(email='bench-author@example.com', password=None, name='bench_author')
+            forum = Forum.objects.create(
+                name='Message benchmark',
+                category=Category.objects.create(name='bench-messages'),
+                created_by=author,
+            )
+            users = User.objects.bulk_create([
+                User(email=f'bench-{i}@example.com', name=f'bench_user_{i}')
+                for i in range(options['mentions'])
+            ])
+            root = Message.objects.create(forum=forum, user=users[0] if users else author, content='root')
+            content = ' '.join(f'@{user.name}' for user in users) or 'no mentions'
+
+            for mode, eager in (('inline', True), ('queued', False)):
+                with override_settings(API_JOBS_EAGER=eager):
+                    latencies = [
+                        self.create(forum, author, content, root)
+                        for _ in range(options['count'])
+                    ]
+                    started = time.perf_counter()
+                    ran = self.drain(options['batch_size'])
+                    worker = (time.perf_counter() - started) * 1000
+                latencies.sort()
+                self.stdout.write(
+                    f'{mode:<8} {statistics.mean(latencies):>8.2f} {latencies[len(latencies) // 2]:>8.2f} '
+                    f'{latencies[int(len(latencies) * 0.9)]:>8.2f} {worker:>10.1f} {ran:>6}'
+                )
+
+            transaction.set_rollback(True)
+
+    def create(self, forum, author, content, parent):
+        started = time.perf_counter()
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(forum=forum, user=author, content=content, parent=parent)
+        return (time.perf_counter() - started) * 1000
+
+    def drain(self, batch_size):
+        # Jobs queue more jobs after commit (mentions -> notifications)
+        ran = 0
+        while Job.objects.filter(status=Job.PENDING).exists():
+            with TestCase.captureOnCommitCallbacks(execute=True):
+                ran += sum(jobs.work(limit=batch_size, once=True))
+        return ran
@@ -0,0 +1,59 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.fastpath import ValuesPlan
+from api.models import Category, Forum, Message, Tag
+from api.planner import plan_queryset
+from api.serializers import ForumSerializer, MessageSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compares rows/s of the DRF serializers and the .values() fast path for forum and message lists. All writes are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help='Forums and messages to create')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per serializer (best is reported)')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        User = get_user_model()
+
+        with transaction.atomic():
+            author = User.objects.create_user(email='bench-serializers@example.com', password=None, name='bench_serializers')
+            category = Category.objects.create(name='bench-serializers')
+            tags = Tag.objects.bulk_create([Tag(name=f'bench-serializers-{i}') for i in range(3)])
+            forums = Forum.objects.bulk_create([
+                Forum(name=f'Forum {i}', category=category, created_by=author) for i in range(rows)
+            ])
+            Forum.tags.through.objects.bulk_create([
+                Forum.tags.through(forum=forum, tag=tag) for forum in forums for tag in tags
+            ])
+            Message.objects.bulk_create([
+                Message(forum=forums[0], user=author, content=f'message {i}') for i in range(rows)
+            ])
+
+            self.stdout.write(f"{'list':<10} {'serializer':>14} {'fast path':>14} {'speedup':>8}")
+            cases = [
+                ('forums', Forum.objects.filter(pk__in=[forum.pk for forum in forums]).order_by('-id'), ForumSerializer()),
+                ('messages', Message.objects.filter(forum=forums[0]).order_by('-id'), MessageSerializer()),
+            ]
+            for name, queryset, serializer in cases:
+                slow = self.best(lambda: type(serializer)(plan_queryset(queryset, serializer), many=True).data, options['repeat'])
+                plan = ValuesPlan(serializer, queryset)
+                fast = self.best(lambda: plan.render(plan.values(queryset)), options['repeat'])
+                self.stdout.write(
+                    f'{name:<10} {rows / slow:>10.0f} r/s {rows / fast:>10.0f} r/s {slow / fast:>7.1f}x'
+                )
+
+            transaction.set_rollback(True)
+
+    def best(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
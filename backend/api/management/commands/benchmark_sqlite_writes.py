@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+# DATABASE_SQLITE_TUNING values compared (see mysite/database.py)
+MODES = {'default': '0', 'tuned': '1'}
+
+
+def setup_django(path, tuning):
+    """
+    Points a fresh process at the benchmark database
+    """
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['DATABASE_SQLITE_TUNING'] = tuning
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+    import django
+    django.setup()
+
+
+def post_messages(forum_id, user_id, count):
+    """
+    Creates count messages through the messages api. Returns
+    (created, failed, seconds).
+    """
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    client.force_authenticate(get_user_model().objects.get(pk=user_id))
+    created = failed = 0
+    started = time.perf_counter()
+    for number in range(count):
+        try:
+            response = client.post('/api/messages/', {'forum': forum_id, 'content': f'load test {number}'})
+        except Exception:
+            # "database is locked" surfaces as an OperationalError
+            failed += 1
+            continue
+        if response.status_code == 201:
+            created += 1
+        else:
+            failed += 1
+    elapsed = time.perf_counter() - started
+    connection.close()
+    return created, failed, elapsed
+
+
+def run_mode(path, tuning, kind, workers, count, results):
+    """
+    Runs in its own process so settings are built for this database
+    """
+    setup_django(path, tuning)
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from django.db import connection
+
+    from api.models import Forum
+
+    call_command('migrate', verbosity=0)
+    user = get_user_model().objects.create_user(email='bench-writes@example.com', password=None, name='bench_writes')
+    forum = Forum.objects.create(name='Write benchmark', created_by=user)
+    cursor = connection.cursor()
+    cursor.execute('PRAGMA journal_mode')
+    journal_mode = cursor.fetchone()[0]
+    connection.close()
+
+    if kind == 'threads':
+        outcomes = []
+        threads = [
+            threading.Thread(target=lambda: outcomes.append(post_messages(forum.pk, user.pk, count)))
+            for _ in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(workers, initializer=setup_django, initargs=(path, tuning)) as pool:
+            outcomes = pool.starmap(post_messages, [(forum.pk, user.pk, count)] * workers)
+
+    results.put((
+        journal_mode,
+        sum(created for created, _, _ in outcomes),
+        sum(failed for _, failed, _ in outcomes),
+        max(elapsed for _, _, elapsed in outcomes),
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates messages through the api from several threads and processes against a '
+        'scratch SQLite file, once with the default journal/locking and once with the tuned '
+        'pragmas, and reports throughput and failed writes. The project database is not touched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--messages', type=int, default=50, help='Messages per thread or process')
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('spawn')
+        self.stdout.write(f"{'mode':<8} {'journal':<8} {'workers':<13} {'created':>8} {'failed':>7} {'msgs/s':>8}")
+        for kind in ('threads', 'processes'):
+            workers = options[kind]
+            if workers < 1:
+                continue
+            for mode, tuning in MODES.items():
+                with tempfile.TemporaryDirectory() as directory:
+                    results = context.Queue()
+                    process = context.Process(
+                        target=run_mode,
+                        args=(os.path.join(directory, 'bench.sqlite3'), tuning, kind, workers, options['messages'], results),
+                    )
+                    process.start()
+                    journal_mode, created, failed, elapsed = results.get()
+                    process.join()
+                label = f'{workers} {kind}'
+                self.stdout.write(
+                    f'{mode:<8} {journal_mode:<8} {label:<13} {created:>8} {failed:>7} {created / elapsed:>8.0f}'
+                )
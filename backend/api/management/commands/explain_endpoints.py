@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.explain import capture_queries, explain, sequential_scans
+from api.models import Category, Forum, Message, Tag
+
+# Lookup tables listed in full (and the facet bitmaps, loaded whole), where
+# reading every row is the point
+FULL_LIST_TABLES = ('api_category', 'api_tag', 'api_forumfacet')
+
+
+class Command(BaseCommand):
+    help = (
+        'Requests each api endpoint with its filters, runs EXPLAIN on every query it issues '
+        'and flags tables read without an index. Run it against realistic data: planners '
+        'happily scan tiny tables.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, help='User to authenticate as (default: the first one)')
+        parser.add_argument('--fail', action='store_true', help='Exit with an error when a scan is flagged')
+
+    def endpoints(self, user):
+        forum = Forum.objects.filter(is_deleted=False).order_by('pk').first()
+        message = Message.objects.order_by('pk').first()
+        category = Category.objects.order_by('pk').first()
+        tag = Tag.objects.order_by('pk').first()
+        forum_id = forum.pk if forum else 0
+
+        yield '/api/categories', {}
+        yield '/api/tags', {}
+        yield '/api/forums/', {}
+        for ordering in ('most_active', 'most_members', 'recent_activity'):
+            yield '/api/forums/', {'ordering': ordering}
+        yield '/api/forums/', {'pagination': 'cursor'}
+        yield '/api/forums/', {'category_id': category.pk if category else 0}
+        yield '/api/forums/', {'user_id': user.pk}
+        yield '/api/forums/', {'is_locked': 'False'}
+        yield '/api/forums/', {'tags_id': tag.pk if tag else 0}
+        yield '/api/forums/', {'tags_id': tag.pk if tag else 0, 'tags_mode': 'all'}
+        yield '/api/forums/facets/', {'tags_id': tag.pk if tag else 0}
+        yield f'/api/forums/{forum_id}/', {}
+        yield '/api/messages/', {'forum_id': forum_id, 'pagination': 'cursor'}
+        yield '/api/messages/', {'user_id': user.pk, 'pagination': 'cursor'}
+        yield '/api/messages/', {'mentioned_user_id': user.pk, 'pagination': 'cursor'}
+        if message is not None:
+            yield f'/api/messages/{message.pk}/thread/', {'pagination': 'cursor'}
+        yield '/api/forum-memberships/', {'forum_id': forum_id, 'pagination': 'cursor'}
+        yield '/api/forum-memberships/', {'user_id': user.pk, 'pagination': 'cursor'}
+        yield '/api/forum-memberships/unread/', {}
+        yield '/api/message-mentions/', {'pagination': 'cursor'}
+        yield '/api/notifications/', {}
+        yield '/api/notifications/', {'unread': 'true'}
+        yield '/api/notifications/unread_count/', {}
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        users = User.objects.order_by('pk')
+        user = users.filter(pk=options['user_id']).first() if options['user_id'] else users.first()
+        if user is None:
+            raise CommandError('No user to authenticate as; create one first')
+
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        flagged = 0
+        # A dummy cache so cached responses still run their queries
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            for path, params in self.endpoints(user):
+                with capture_queries(connection) as queries:
+                    response = client.get(path, params)
+                query_string = '&'.join(f'{key}={value}' for key, value in params.items())
+                label = f'{path}?{query_string}' if query_string else path
+                self.stdout.write(f'{label} ({response.status_code}, {len(queries)} queries)')
+
+                for sql, query_params in queries:
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    plan = explain(connection, sql, query_params)
+                    scans = sequential_scans(plan, allowed=FULL_LIST_TABLES)
+                    if scans:
+                        flagged += 1
+                        self.stdout.write(self.style.WARNING(f"  sequential scan of {', '.join(scans)}: {sql}"))
+                    if scans or options['verbosity'] > 1:
+                        for line in plan:
+                            self.stdout.write(f'    {line}')
+
+        if flagged:
+            message = f'{flagged} queries read tables without an index'
+            if options['fail']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('No sequential scans'))
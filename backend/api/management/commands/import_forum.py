@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import Importer, read_csv, read_jsonl
+from api.models import Forum
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+
+
+class Command(BaseCommand):
+    help = 'Imports a forum archive written by export_forum, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help='Default: from the file extension')
+        parser.add_argument(
+            '--forum-id', type=int,
+            help='Add the messages to this existing forum instead of creating one (required for CSV)',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Messages written per transaction')
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='Create users for unknown emails instead of skipping their messages',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+
+        forum = None
+        if options['forum_id'] is not None:
+            try:
+                forum = Forum.objects.get(pk=options['forum_id'])
+            except Forum.DoesNotExist:
+                raise CommandError(f'Forum {options["forum_id"]} does not exist')
+        elif fmt == 'csv':
+            raise CommandError('CSV archives have no forum header; pass --forum-id')
+
+        importer = Importer(
+            forum=forum,
+            batch_size=options['batch_size'],
+            create_users=options['create_users'],
+            progress=self.progress,
+        )
+        with open(path, encoding='utf-8', newline='') as stream:
+            rows = READERS[fmt](stream)
+            if forum is not None and fmt == 'jsonl':
+                # The header describes the source forum, which isn't used here
+                rows = (row for row in rows if row.get('type') != 'forum')
+            try:
+                forum = importer.run(rows)
+            except (ValueError, KeyError) as exc:
+                raise CommandError(f'Invalid archive: {exc}')
+
+        elapsed = time.monotonic() - importer.started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.imported} messages and {importer.mentions} mentions into forum {forum.pk} '
+            f'in {elapsed:.1f}s ({importer.rate:.0f} rows/s), skipped {importer.skipped}'
+        ))
+
+    def progress(self, importer):
+        if self.verbosity > 1:
+            self.stdout.write(f'{importer.imported} messages ({importer.rate:.0f} rows/s)')
@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import loadtest
+from api.models import Forum
+
+# Deployments --serve can start, as (command, extra environment). Each gets
+# --workers processes; gunicorn's sync workers also get --threads threads.
+SERVERS = {
+    'wsgi': (
+        ['gunicorn', 'mysite.wsgi:application', '--workers', '{workers}', '--threads', '{threads}',
+         '--bind', '127.0.0.1:{port}'],
+        {},
+    ),
+    'asgi': (
+        ['uvicorn', 'mysite.asgi:application', '--workers', '{workers}', '--port', '{port}', '--no-access-log'],
+        {'API_ASYNC_VIEWS': '1'},
+    ),
+    # ASGI with the regular sync views, i.e. each request in a worker thread
+    'asgi-sync': (
+        ['uvicorn', 'mysite.asgi:application', '--workers', '{workers}', '--port', '{port}', '--no-access-log'],
+        {'API_ASYNC_VIEWS': '0'},
+    ),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'The server exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f'The server did not start listening on port {port}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Load tests the hot read endpoints on one or more deployments and compares requests per '
+        'second and latency percentiles. Use --serve to start WSGI (gunicorn) and ASGI (uvicorn) '
+        'servers on this project, or --target for servers that are already running.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--serve', action='append', choices=sorted(SERVERS), default=[],
+                            help='Start this deployment on a free port (repeatable)')
+        parser.add_argument('--target', action='append', default=[], metavar='NAME=URL',
+                            help='Base URL of a running deployment, e.g. asgi=http://127.0.0.1:8001')
+        parser.add_argument('--path', action='append', default=[],
+                            help='Path to request (repeatable), by default the hot read endpoints')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per deployment')
+        parser.add_argument('--warmup', type=float, default=2.0, help='Seconds of unmeasured load first')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--token', help='Access token sent as a Bearer Authorization header')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def default_paths(self):
+        paths = ['/api/categories', '/api/tags', '/api/forums/']
+        forum_id = (
+            Forum.objects.filter(is_deleted=False).order_by('-message_count')
+            .values_list('id', flat=True).first()
+        )
+        if forum_id is not None:
+            paths += [f'/api/forums/{forum_id}/', f'/api/messages/?forum_id={forum_id}&pagination=cursor']
+        return paths
+
+    def start(self, name, options):
+        command, environment = SERVERS[name]
+        if shutil.which(command[0]) is None:
+            raise CommandError(f'{command[0]} is not installed (pip install gunicorn uvicorn)')
+        port = free_port()
+        command = [part.format(port=port, workers=options['workers'], threads=options['threads']) for part in command]
+        process = subprocess.Popen(
+            command,
+            cwd=settings.BASE_DIR,
+            env={**os.environ, **environment},
+            stdout=subprocess.DEVNULL,
+            stderr=None if options['verbosity'] > 1 else subprocess.DEVNULL,
+        )
+        try:
+            wait_for(port, process)
+        except CommandError:
+            process.kill()
+            raise
+        return process, f'http://127.0.0.1:{port}'
+
+    def measure(self, url, paths, options):
+        headers = {'Authorization': f"Bearer {options['token']}"} if options['token'] else None
+        if options['warmup'] > 0:
+            loadtest.run(url, paths, concurrency=options['concurrency'], duration=options['warmup'], headers=headers)
+        return loadtest.run(url, paths, concurrency=options['concurrency'], duration=options['duration'], headers=headers)
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, _, url = target.partition('=')
+            if not url:
+                raise CommandError(f'--target must look like NAME=URL, not {target!r}')
+            targets.append((name, url))
+        if not targets and not options['serve']:
+            raise CommandError('Give at least one --serve or --target')
+        paths = options['path'] or self.default_paths()
+
+        results = {}
+        for name, url in targets:
+            results[name] = self.measure(url, paths, options)
+        for name in options['serve']:
+            process, url = self.start(name, options)
+            try:
+                results[name] = self.measure(url, paths, options)
+            finally:
+                process.terminate()
+                process.wait(10)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'paths': paths, 'results': results}, indent=2))
+            return
+        self.stdout.write(f"{len(paths)} paths, {options['concurrency']} clients, {options['duration']:g}s each")
+        self.stdout.write(f"{'deployment':<12} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<12} {result['requests']:>9} {result['errors']:>7} {result['rps']:>9.1f} "
+                f"{result['p50_ms'] or 0:>8.1f} {result['p99_ms'] or 0:>8.1f}"
+            )
+        if any(result['errors'] for result in results.values()):
+            self.stderr.write('Some requests failed, see the statuses with --json')
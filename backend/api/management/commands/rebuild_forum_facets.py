@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import facets
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the category and tag bitmaps behind /api/forums/facets/.'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = facets.rebuild()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Built {count} facet bitmaps in {elapsed:.1f}s'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.counters import recompute_counters
+from api.models import Forum
+
+
+class Command(BaseCommand):
+    help = 'Recomputes member_count, message_count and last_activity_at for forums to repair counter drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('forum_ids', nargs='*', type=int, help='Only these forums (default: all)')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Forums updated per transaction',
+        )
+
+    def handle(self, *args, **options):
+        forums = Forum.objects.all()
+        if options['forum_ids']:
+            forums = forums.filter(pk__in=options['forum_ids'])
+
+        ids = list(forums.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            with transaction.atomic():
+                updated += recompute_counters(Forum.objects.filter(pk__in=batch))
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed counters for {updated} forums'))
@@ -0,0 +1,48 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from api import jobs
+from api.realtime import get_broker
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs queued jobs (mentions, notifications, search indexing) until stopped. '
+        'SIGINT/SIGTERM finish the current batch first. Run as many workers as needed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no job is ready')
+        parser.add_argument('--batch-size', type=int, default=100, help='Jobs claimed at a time')
+        parser.add_argument('--lease', type=int, default=300,
+                            help='Seconds after which jobs claimed by a dead worker run again')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when idle')
+
+    def handle(self, *args, **options):
+        # Jobs publish realtime events (@mentions); from this process they
+        # only reach the websockets through a broker shared with the servers
+        if not getattr(get_broker(), 'shared', True):
+            self.stderr.write(self.style.WARNING(
+                'API_REALTIME_BROKER only delivers events within one process: @mention events of the jobs run '
+                'here will not reach websocket clients. Use api.realtime.RedisBroker for them.'
+            ))
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+
+        previous = {signum: signal.signal(signum, stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            done, failed = jobs.work(
+                limit=options['batch_size'],
+                lease=options['lease'],
+                poll_interval=options['poll_interval'],
+                stop=lambda: bool(stopping),
+                once=options['once'],
+            )
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+        self.stdout.write(self.style.SUCCESS(f'Ran {done} jobs, {failed} failed'))
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.seeding import PASSWORD, Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills the database with synthetic users, categories, tags, forums, memberships and '
+        'message trees for benchmarks. The same options and --seed give the same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--forums', type=int, default=20)
+        parser.add_argument('--messages', type=int, default=500, help='Messages per forum')
+        parser.add_argument('--categories', type=int, default=5)
+        parser.add_argument('--tags', type=int, default=20)
+        parser.add_argument('--tags-per-forum', type=int, default=3)
+        parser.add_argument('--memberships', type=int, default=5, help='Forums joined per user')
+        parser.add_argument('--max-depth', type=int, default=20, help='Deepest reply level')
+        parser.add_argument('--mention-rate', type=float, default=0.1, help='Share of messages with an @mention')
+        parser.add_argument('--days', type=int, default=30, help='Messages are spread over this many days up to now')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed', help='Prefix of the names and emails of what is created')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows written per query')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('--users must be at least 1')
+        self.verbosity = options['verbosity']
+        started = time.monotonic()
+        seeder = Seeder(prefix=options['prefix'], seed=options['seed'], batch_size=options['batch_size'],
+                        progress=self.progress)
+        try:
+            counts = seeder.run(
+                users=options['users'],
+                forums=options['forums'],
+                messages=options['messages'],
+                categories=options['categories'],
+                tags=options['tags'],
+                tags_per_forum=options['tags_per_forum'],
+                memberships=options['memberships'],
+                max_depth=options['max_depth'],
+                mention_rate=options['mention_rate'],
+                days=options['days'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        elapsed = time.monotonic() - started
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Created {summary} in {elapsed:.1f}s'))
+        self.stdout.write(f"Users log in as {options['prefix']}-user-N@example.com with password {PASSWORD!r}")
+
+    def progress(self, seeder):
+        if self.verbosity > 1:
+            self.stdout.write(f"{seeder.counts.get('messages', 0)} messages")
@@ -0,0 +1,142 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .jobs import task
+from .notifications import notify_mentions
+from .realtime import mention_events
+
+MENTION_RE = re.compile(r'@(\w+)')
+
+# Cache key prefix for the name -> user id map
+CACHE_PREFIX = 'mentions:name:'
+
+# Stored in the cache for names that don't belong to any user, so unknown
+# @tokens don't hit the database on every message either
+MISSING = 0
+
+
+def cache_timeout():
+    """
+    Seconds to keep a resolved name in the cache; 0 disables caching
+    """
+    return getattr(settings, 'API_MENTION_CACHE_TIMEOUT', 300)
+
+
+def find_mentions(content):
+    """
+    Returns the unique @names in content, in order of first appearance
+    """
+    return list(dict.fromkeys(MENTION_RE.findall(content or '')))
+
+
+def resolve_names(names):
+    """
+    Maps names to user ids using at most one query.
+
+    Names that are shared by several users resolve to the oldest account.
+    Unknown names are left out of the result.
+    """
+    if not names:
+        return {}
+
+    timeout = cache_timeout()
+    resolved = {}
+    missing = list(names)
+
+    if timeout:
+        cached = cache.get_many([CACHE_PREFIX + name for name in names])
+        missing = []
+        for name in names:
+            user_id = cached.get(CACHE_PREFIX + name)
+            if user_id is None:
+                missing.append(name)
+            elif user_id != MISSING:
+                resolved[name] = user_id
+
+    if missing:
+        User = get_user_model()
+        found = {}
+        rows = User.objects.filter(name__in=missing).order_by('id').values_list('name', 'id')
+        for name, user_id in rows:
+            found.setdefault(name, user_id)
+        resolved.update(found)
+
+        if timeout:
+            cache.set_many(
+                {CACHE_PREFIX + name: found.get(name, MISSING) for name in missing},
+                timeout,
+            )
+
+    return resolved
+
+
+def forget_name(name):
+    """
+    Drops a cached name lookup, e.g. after a user is created or renamed
+    """
+    if name:
+        cache.delete(CACHE_PREFIX + name)
+
+
+def sync_mentions(message, created=False):
+    """
+    Brings the MessageMention rows of message in line with its content.
+
+    New messages only need a bulk insert. Edited messages are diffed against
+    the existing mentions so re-saving never creates duplicates.
+    """
+    from .models import MessageMention
+
+    user_ids = set(resolve_names(find_mentions(message.content)).values())
+
+    if created:
+        existing = set()
+    else:
+        existing = set(
+            MessageMention.objects.filter(message=message).values_list('mentioned_user_id', flat=True)
+        )
+        removed = existing - user_ids
+        if removed:
+            MessageMention.objects.filter(message=message, mentioned_user_id__in=removed).delete()
+
+    added = user_ids - existing
+    if added:
+        MessageMention.objects.bulk_create(
+            [MessageMention(message=message, mentioned_user_id=user_id) for user_id in sorted(added)]
+        )
+        mention_events(message, sorted(added))
+        notify_mentions(message, sorted(added))
+
+
+@task('mentions.sync')
+def sync_message_mentions(message_id):
+    """
+    Job queued by Message.save() when the content changes. Always diffs, so
+    a retry or a second job for the same message changes nothing.
+    """
+    from .models import Message
+
+    message = Message.objects.filter(pk=message_id).first()
+    if message is not None:
+        sync_mentions(message)
+
+
+def create_mentions_bulk(messages):
+    """
+    Mentions for a batch of newly inserted messages with one name lookup
+    and one insert, e.g. for imports. No events are published.
+    """
+    from .models import MessageMention
+
+    names_by_message = [(message, find_mentions(message.content)) for message in messages]
+    resolved = resolve_names(list(dict.fromkeys(name for _, names in names_by_message for name in names)))
+
+    mentions = []
+    for message, names in names_by_message:
+        user_ids = dict.fromkeys(resolved[name] for name in names if name in resolved)
+        mentions += [MessageMention(message=message, mentioned_user_id=user_id) for user_id in user_ids]
+    MessageMention.objects.bulk_create(mentions)
+    return len(mentions)
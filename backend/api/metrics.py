@@ -0,0 +1,375 @@
+"""
+Per-route request metrics, served in the Prometheus text format at /metrics
+and summed up for each response in a Server-Timing header.
+
+MetricsMiddleware times every request and counts it by route, method and
+status, with the size of the body. A sample of the requests
+(API_METRICS_SAMPLE_RATE) is measured in more depth: database queries are
+counted and timed by an execute wrapper on every connection, and the time
+spent building representations (serializers and ValuesPlan) and rendering
+the body is added up. Everything else costs a couple of clock reads and a
+lock per request, so the sample rate bounds the overhead.
+
+With API_SLOW_REQUEST_SECONDS set, sampled requests also keep the SQL and
+the project's stack frames for each query, and the ones slower than that
+are logged to the api.slow logger with their slowest queries.
+
+Numbers are per process, like cache_stats().
+"""
+import bisect
+import hmac
+import logging
+import random
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .caching import cache_stats
+
+logger = logging.getLogger('api.slow')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# name: (help, buckets); the sampled ones only see sampled requests
+HISTOGRAMS = {
+    'api_request_duration_seconds': ('Time to answer a request', LATENCY_BUCKETS),
+    'api_response_size_bytes': ('Size of response bodies (streams excluded)', SIZE_BUCKETS),
+    'api_request_queries': ('Database queries per sampled request', QUERY_BUCKETS),
+    'api_request_query_seconds': ('Database time per sampled request', LATENCY_BUCKETS),
+    'api_request_serialize_seconds': ('Time building representations per sampled request', LATENCY_BUCKETS),
+    'api_request_render_seconds': ('Time rendering the body per sampled request', LATENCY_BUCKETS),
+}
+COUNTERS = {
+    'api_requests_total': 'Requests answered',
+    'api_slow_requests_total': 'Requests slower than API_SLOW_REQUEST_SECONDS',
+}
+
+# Slowest queries and innermost project frames per query in the slow log
+SLOW_QUERY_LIMIT = 10
+STACK_DEPTH = 8
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # counts[i] is for values up to buckets[i], the last one for the rest
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+histograms = {}
+counters = {}
+lock = threading.Lock()
+
+
+def observe(name, labels, value):
+    with lock:
+        histogram = histograms.get((name, labels))
+        if histogram is None:
+            histogram = histograms[(name, labels)] = Histogram(HISTOGRAMS[name][1])
+        histogram.observe(value)
+
+
+def increment(name, labels):
+    with lock:
+        counters[(name, labels)] = counters.get((name, labels), 0) + 1
+
+
+def reset():
+    with lock:
+        histograms.clear()
+        counters.clear()
+
+
+class Sample:
+    """
+    What is measured of one sampled request
+    """
+
+    def __init__(self, keep_queries):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.timings = {}
+        # Segments being timed, so nested serializers only count once
+        self.active = set()
+        # (seconds, sql, stack) per query, for the slow log
+        self.statements = [] if keep_queries else None
+
+    def add(self, segment, seconds):
+        self.timings[segment] = self.timings.get(segment, 0.0) + seconds
+
+
+current = ContextVar('api_metrics_sample', default=None)
+
+
+def project_stack():
+    base = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(base) and 'site-packages' not in frame.filename
+    ]
+    return traceback.format_list(frames[-STACK_DEPTH:])
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection; only sampled requests
+    pay for more than the context variable lookup
+    """
+    sample = current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - started
+        sample.queries += 1
+        sample.query_seconds += seconds
+        if sample.statements is not None:
+            sample.statements.append((seconds, sql, project_stack()))
+
+
+def instrument(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def timed(segment, function, *args):
+    """
+    Calls function(*args), adding its duration to segment for sampled
+    requests unless an outer call is already timing that segment
+    """
+    sample = current.get()
+    if sample is None or segment in sample.active:
+        return function(*args)
+    sample.active.add(segment)
+    started = time.perf_counter()
+    try:
+        return function(*args)
+    finally:
+        sample.active.discard(segment)
+        sample.add(segment, time.perf_counter() - started)
+
+
+@contextmanager
+def timer(segment):
+    """
+    timed() as a context manager, e.g. around code with awaits
+    """
+    sample = current.get()
+    if sample is None or segment in sample.active:
+        yield
+        return
+    sample.active.add(segment)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        sample.active.discard(segment)
+        sample.add(segment, time.perf_counter() - started)
+
+
+class TimedMixin:
+    """
+    For serializers: adds the time spent building representations to the
+    serialize segment
+    """
+
+    def to_representation(self, instance):
+        return timed('serialize', super().to_representation, instance)
+
+
+def slow_threshold():
+    return getattr(settings, 'API_SLOW_REQUEST_SECONDS', None)
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.route
+
+
+def server_timing(seconds, sample):
+    parts = [f'total;dur={seconds * 1000:.1f}']
+    if sample is not None:
+        parts.append(f'db;dur={sample.query_seconds * 1000:.1f};desc="{sample.queries} queries"')
+        parts += [f'{segment};dur={value * 1000:.1f}' for segment, value in sorted(sample.timings.items())]
+    return ', '.join(parts)
+
+
+def log_slow(request, route, seconds, sample):
+    lines = [
+        f'{request.method} {request.get_full_path()} ({route}) took {seconds * 1000:.0f} ms, '
+        f'{sample.queries} queries in {sample.query_seconds * 1000:.0f} ms'
+    ]
+    for query_seconds, sql, stack in sorted(sample.statements, key=lambda statement: -statement[0])[:SLOW_QUERY_LIMIT]:
+        lines.append(f'{query_seconds * 1000:.1f} ms: {sql}')
+        lines += [line.rstrip('\n') for line in stack]
+    logger.warning('\n'.join(lines))
+
+
+class MetricsMiddleware:
+    """
+    Records the metrics of every request and adds a Server-Timing header;
+    goes first in MIDDLEWARE so the other middleware is timed too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def start(self):
+        rate = getattr(settings, 'API_METRICS_SAMPLE_RATE', 0.1)
+        if rate and random.random() < rate:
+            return Sample(keep_queries=slow_threshold() is not None)
+        return None
+
+    def process_template_response(self, request, response):
+        # Called right before the body is rendered
+        sample = current.get()
+        if sample is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(lambda _: sample.add('render', time.perf_counter() - started))
+        return response
+
+    def finish(self, request, response, sample, started):
+        seconds = time.perf_counter() - started
+        route = route_name(request)
+        labels = (('route', route), ('method', request.method))
+
+        increment('api_requests_total', labels + (('status', str(response.status_code)),))
+        observe('api_request_duration_seconds', labels, seconds)
+        if not response.streaming:
+            observe('api_response_size_bytes', labels, len(response.content))
+        if sample is not None:
+            observe('api_request_queries', labels, sample.queries)
+            observe('api_request_query_seconds', labels, sample.query_seconds)
+            observe('api_request_serialize_seconds', labels, sample.timings.get('serialize', 0.0))
+            observe('api_request_render_seconds', labels, sample.timings.get('render', 0.0))
+
+        threshold = slow_threshold()
+        if threshold is not None and seconds >= threshold:
+            increment('api_slow_requests_total', (('route', route),))
+            if sample is not None:
+                log_slow(request, route, seconds, sample)
+
+        if getattr(settings, 'API_SERVER_TIMING', True):
+            response['Server-Timing'] = server_timing(seconds, sample)
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        sample = self.start()
+        token = current.set(sample)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, sample, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        sample = self.start()
+        token = current.set(sample)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, sample, started)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format
+    """
+    with lock:
+        counter_items = sorted(counters.items())
+        histogram_items = sorted(
+            (key, (list(histogram.counts), histogram.sum, histogram.count))
+            for key, histogram in histograms.items()
+        )
+    for endpoint, outcomes in sorted(cache_stats().items()):
+        for outcome, count in sorted(outcomes.items()):
+            counter_items.append((('api_response_cache_total', (('endpoint', endpoint), ('outcome', outcome))), count))
+
+    lines = []
+    helps = {**COUNTERS, 'api_response_cache_total': 'Cached responses by endpoint and outcome'}
+    for name, help_text in helps.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines += [
+            f'{name}{format_labels(labels)} {count}'
+            for (item_name, labels), count in counter_items if item_name == name
+        ]
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (item_name, labels), (counts, total, count) in histogram_items:
+            if item_name != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", format_value(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(total)}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def allowed(request):
+    """
+    With API_METRICS_TOKEN set, requests must send it as a bearer token.
+    Otherwise only the addresses in API_METRICS_ALLOWED_IPS get in, which
+    is only safe without a reverse proxy in front (all requests come from
+    the proxy's address then); nobody does when the list is empty.
+    """
+    token = getattr(settings, 'API_METRICS_TOKEN', None)
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
+    addresses = getattr(settings, 'API_METRICS_ALLOWED_IPS', None) or ()
+    return request.META.get('REMOTE_ADDR') in addresses
+
+
+def metrics_view(request):
+    """
+    Scrape endpoint, for the scrapers allowed() lets in
+    """
+    if not allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(fields=['-created_at', '-id'], name='forum_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forummembership',
+            index=models.Index(fields=['forum', 'joined_at', 'id'], name='membership_forum_joined_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forummembership',
+            index=models.Index(fields=['user', 'joined_at', 'id'], name='membership_user_joined_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['forum', '-created_at', '-id'], name='message_forum_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['-created_at', '-id'], name='message_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messagemention',
+            index=models.Index(fields=['mentioned_user', '-id'], name='mention_user_id_idx'),
+        ),
+    ]
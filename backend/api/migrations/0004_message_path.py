@@ -0,0 +1,72 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:39
+
+from django.db import migrations, models
+
+PATH_STEP = 8
+PATH_MAX_LENGTH = 1024
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def path_segment(pk):
+    segment = ''
+    while pk:
+        pk, remainder = divmod(pk, 36)
+        segment = DIGITS[remainder] + segment
+    return segment.rjust(PATH_STEP, '0')
+
+
+def backfill_paths(apps, schema_editor):
+    """
+    Builds paths for existing messages. Replies can have been re-parented
+    to later messages (the API allowed PATCHing parent), so each path is
+    built by walking up to a message whose path is known or a root.
+    Cycles and threads deeper than the path allows stop the migration.
+    """
+    Message = apps.get_model('api', 'Message')
+    parents = dict(Message.objects.values_list('id', 'parent_id').iterator(chunk_size=2000))
+    paths = {}
+    for pk in parents:
+        chain = []
+        node = pk
+        while node is not None and node not in paths:
+            if node in chain:
+                raise RuntimeError(f'Message {node} is its own ancestor; fix its parent before migrating')
+            chain.append(node)
+            node = parents[node]
+        path = paths[node] if node is not None else ''
+        for node in reversed(chain):
+            path += path_segment(node)
+            paths[node] = path
+        if len(path) > PATH_MAX_LENGTH:
+            raise RuntimeError(f'Message {pk} is nested deeper than {PATH_MAX_LENGTH // PATH_STEP} levels')
+
+    batch = []
+    for pk in sorted(paths):
+        path = paths[pk]
+        batch.append(Message(id=pk, path=path, depth=len(path) // PATH_STEP - 1))
+        if len(batch) >= 2000:
+            Message.objects.bulk_update(batch, ['path', 'depth'])
+            batch = []
+    if batch:
+        Message.objects.bulk_update(batch, ['path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=1024),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:40
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Forum = apps.get_model('api', 'Forum')
+    ForumMembership = apps.get_model('api', 'ForumMembership')
+    Message = apps.get_model('api', 'Message')
+
+    def per_forum(model, aggregate):
+        return Subquery(
+            model.objects.filter(forum=OuterRef('pk')).order_by().values('forum')
+            .annotate(value=aggregate).values('value')
+        )
+
+    Forum.objects.update(
+        member_count=Coalesce(per_forum(ForumMembership, Count('*')), 0, output_field=IntegerField()),
+        message_count=Coalesce(per_forum(Message, Count('*')), 0, output_field=IntegerField()),
+        last_activity_at=Coalesce(per_forum(Message, Max('created_at')), F('created_at')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_message_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forum',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='forum',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='forum',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(fields=['-message_count', '-id'], name='forum_message_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(fields=['-member_count', '-id'], name='forum_member_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(fields=['-last_activity_at', '-id'], name='forum_last_activity_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
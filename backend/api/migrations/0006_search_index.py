@@ -0,0 +1,70 @@
+from django.db import migrations
+
+SQLITE_CREATE = """
+CREATE VIRTUAL TABLE api_search_fts USING fts5(
+    title, body,
+    kind UNINDEXED, object_id UNINDEXED, forum_id UNINDEXED,
+    tokenize = 'porter unicode61'
+)
+"""
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE api_search_document (
+        id bigint PRIMARY KEY,
+        kind varchar(16) NOT NULL,
+        object_id bigint NOT NULL,
+        forum_id bigint NOT NULL,
+        title text NOT NULL DEFAULT '',
+        body text NOT NULL DEFAULT '',
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', title), 'A') ||
+            setweight(to_tsvector('english', body), 'B')
+        ) STORED
+    )
+    """,
+    'CREATE INDEX api_search_document_gin ON api_search_document USING gin (document)',
+    'CREATE INDEX api_search_document_forum ON api_search_document (forum_id, kind)',
+]
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+    elif vendor == 'postgresql':
+        for statement in POSTGRES_CREATE:
+            schema_editor.execute(statement)
+    else:
+        return
+
+    # Index what's already there; later changes are picked up by signals
+    table = 'api_search_fts' if vendor == 'sqlite' else 'api_search_document'
+    columns = 'rowid, title, body, kind, object_id, forum_id' if vendor == 'sqlite' else 'id, title, body, kind, object_id, forum_id'
+    schema_editor.execute(
+        f"INSERT INTO {table} ({columns}) "
+        f"SELECT id * 2, name, description, 'forum', id, id FROM api_forum WHERE NOT is_deleted"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {table} ({columns}) "
+        f"SELECT id * 2 + 1, '', content, 'message', id, forum_id FROM api_message"
+    )
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS api_search_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS api_search_document')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_forum_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
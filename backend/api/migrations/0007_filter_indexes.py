@@ -0,0 +1,63 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='forum',
+            name='forum_created_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='forum',
+            name='forum_message_count_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='forum',
+            name='forum_member_count_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='forum',
+            name='forum_last_activity_idx',
+        ),
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-created_at', '-id'], name='forum_live_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-message_count', '-id'], name='forum_live_message_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-member_count', '-id'], name='forum_live_member_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-last_activity_at', '-id'], name='forum_live_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['category', '-created_at', '-id'], name='forum_live_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['created_by', '-created_at', '-id'], name='forum_live_creator_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forum',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['is_locked', '-created_at', '-id'], name='forum_live_locked_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='message_user_created_idx'),
+        ),
+    ]
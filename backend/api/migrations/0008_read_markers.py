@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def mark_existing_read(apps, schema_editor):
+    # Members start with their forums read, not with the whole history unread
+    ForumMembership = apps.get_model('api', 'ForumMembership')
+    Message = apps.get_model('api', 'Message')
+    latest = Subquery(Message.objects.filter(forum_id=OuterRef('forum_id')).order_by('-id').values('id')[:1])
+    ForumMembership.objects.update(last_read_message_id=Coalesce(latest, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forummembership',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='forummembership',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['forum', 'id'], name='message_forum_id_idx'),
+        ),
+        migrations.RunPython(mark_existing_read, migrations.RunPython.noop),
+    ]
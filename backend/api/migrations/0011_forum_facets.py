@@ -0,0 +1,50 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:35
+
+from django.db import migrations, models
+
+
+def build_facets(apps, schema_editor):
+    # Same bitmaps as api.facets.rebuild(), from the historical models
+    Forum = apps.get_model('api', 'Forum')
+    ForumFacet = apps.get_model('api', 'ForumFacet')
+
+    members = {}
+    for forum_id, category_id in Forum.objects.filter(is_deleted=False).values_list('id', 'category_id'):
+        members.setdefault(('all', 0), set()).add(forum_id)
+        if category_id is not None:
+            members.setdefault(('category', category_id), set()).add(forum_id)
+    links = Forum.tags.through.objects.filter(forum__is_deleted=False).values_list('tag_id', 'forum_id')
+    for tag_id, forum_id in links:
+        members.setdefault(('tag', tag_id), set()).add(forum_id)
+
+    rows = []
+    for (kind, value_id), ids in members.items():
+        data = bytearray(max(ids) // 8 + 1)
+        for forum_id in ids:
+            data[forum_id >> 3] |= 1 << (forum_id & 7)
+        rows.append(ForumFacet(kind=kind, value_id=value_id, bitmap=bytes(data), forum_count=len(ids)))
+    ForumFacet.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForumFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('all', 'All'), ('category', 'Category'), ('tag', 'Tag')], max_length=10)),
+                ('value_id', models.PositiveBigIntegerField()),
+                ('bitmap', models.BinaryField(default=bytes)),
+                ('forum_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'value_id'), name='forum_facet_unique')],
+            },
+        ),
+        migrations.RunPython(build_facets, migrations.RunPython.noop),
+    ]
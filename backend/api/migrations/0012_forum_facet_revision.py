@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_forum_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forumfacet',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
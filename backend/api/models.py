@@ -1,6 +1,10 @@
 from django.db import models
 from django.conf import settings
-import re
+from django.utils import timezone
+from . import jobs
+from .mentions import sync_message_mentions
+from .notifications import notify_reply
+from .tree import PATH_MAX_LENGTH, check_parent, move_subtree, path_for
 
 # Categories for forums (e.g., Technology, Science)
 class Category(models.Model):
@@ -16,6 +20,10 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+# The forum list only ever reads forums that aren't deleted, so its indexes
+# are partial (skipped on databases without partial index support)
+LIVE_FORUMS = models.Q(is_deleted=False)
+
 # Main Forum model
 class Forum(models.Model):
     name = models.CharField(max_length=255)
@@ -27,9 +35,35 @@ class Forum(models.Model):
     is_deleted = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counters, kept up to date by the viewsets (see api.counters)
+    # and repaired with `manage.py recompute_forum_counters`
+    member_count = models.PositiveIntegerField(default=0, editable=False)
+    message_count = models.PositiveIntegerField(default=0, editable=False)
+    last_activity_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order for the forum list and its sort options
+            models.Index(fields=['-created_at', '-id'], condition=LIVE_FORUMS, name='forum_live_created_idx'),
+            models.Index(fields=['-message_count', '-id'], condition=LIVE_FORUMS, name='forum_live_message_count_idx'),
+            models.Index(fields=['-member_count', '-id'], condition=LIVE_FORUMS, name='forum_live_member_count_idx'),
+            models.Index(fields=['-last_activity_at', '-id'], condition=LIVE_FORUMS, name='forum_live_activity_idx'),
+            # ?category_id=, ?user_id= and ?is_locked= in the default order
+            models.Index(fields=['category', '-created_at', '-id'], condition=LIVE_FORUMS, name='forum_live_category_idx'),
+            models.Index(fields=['created_by', '-created_at', '-id'], condition=LIVE_FORUMS, name='forum_live_creator_idx'),
+            models.Index(fields=['is_locked', '-created_at', '-id'], condition=LIVE_FORUMS, name='forum_live_locked_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the facet index holds for this forum (see api.facets)
+        if 'category_id' in instance.__dict__ and 'is_deleted' in instance.__dict__:
+            instance._loaded_facets = (instance.category_id, instance.is_deleted)
+        return instance
     
     
         
@@ -39,9 +73,18 @@ class ForumMembership(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='memberships')
     forum = models.ForeignKey(Forum, on_delete=models.CASCADE, related_name='memberships')
     joined_at = models.DateTimeField(auto_now_add=True)
+    # Read marker (see api.unread): messages with a higher id are unread.
+    # A plain id rather than a foreign key, so deleting that message
+    # doesn't move the marker
+    last_read_message_id = models.BigIntegerField(default=0, editable=False)
+    last_read_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         unique_together = ('user', 'forum')
+        indexes = [
+            models.Index(fields=['forum', 'joined_at', 'id'], name='membership_forum_joined_idx'),
+            models.Index(fields=['user', 'joined_at', 'id'], name='membership_user_joined_idx'),
+        ]
 
 # Messages within forums; supports threaded replies using a self-reference
 class Message(models.Model):
@@ -49,29 +92,161 @@ class Message(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='messages')
     content = models.TextField()
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies')
+    # Materialized path of ancestor ids (see api.tree), maintained by save()
+    path = models.CharField(max_length=PATH_MAX_LENGTH, db_index=True, editable=False, default='')
+    depth = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination order, per forum and overall
+            models.Index(fields=['forum', '-created_at', '-id'], name='message_forum_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='message_created_id_idx'),
+            # ?user_id=
+            models.Index(fields=['user', '-created_at', '-id'], name='message_user_created_idx'),
+            # Messages after a read marker (see api.unread)
+            models.Index(fields=['forum', 'id'], name='message_forum_id_idx'),
+        ]
+
     def __str__(self):
         return f"Message by {self.user} in {self.forum}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember stored values so save() can tell whether mentions or the
+        # thread path need updating
+        instance._loaded_content = instance.__dict__.get('content')
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        return instance
+
     def save(self, *args, **kwargs):
+        created = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        content_changed = created or getattr(self, '_loaded_content', None) != self.content
+        if update_fields is not None and 'content' not in update_fields:
+            content_changed = False
+
+        moved = not created and self.parent_id != getattr(self, '_loaded_parent_id', self.parent_id)
+        if created or moved:
+            check_parent(self, self.parent)
+        if moved:
+            old_path, old_depth = self.path, self.depth
+            self.path, self.depth = path_for(self)
+
         super().save(*args, **kwargs)
-        self.extract_mentions()
-        
+
+        if created:
+            self.path, self.depth = path_for(self)
+            Message.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+        elif moved:
+            move_subtree(Message.objects.all(), old_path, old_depth, self.path, self.depth)
+        self._loaded_parent_id = self.parent_id
+
+        if content_changed:
+            self.extract_mentions()
+            self._loaded_content = self.content
+
+        if created and self.parent_id is not None:
+            notify_reply(self)
+
     def extract_mentions(self):
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        
-        mentioned_usernames = re.findall(r'@(\w+)', self.content)
-        for username in mentioned_usernames:
-            try:
-                user = User.objects.get(name=username)
-                MessageMention.objects.create(message=self, mentioned_user=user)
-            except User.DoesNotExist:
-                pass
+        # Resolved by a job (see api.jobs); one pending job per message
+        # covers any number of edits
+        jobs.enqueue(sync_message_mentions, {'message_id': self.pk}, key=f'mentions:{self.pk}')
 
 # Optional: Track when users are mentioned in messages
 class MessageMention(models.Model):
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='mentions')
     mentioned_user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='mentioned_in')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['mentioned_user', '-id'], name='mention_user_id_idx'),
+        ]
+
+
+# Inbox of a user: mentions of them and replies to their messages, written
+# by jobs queued when the message is posted (see api.notifications)
+class Notification(models.Model):
+    MENTION = 'mention'
+    REPLY = 'reply'
+    KINDS = [(MENTION, 'Mention'), (REPLY, 'Reply')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=10, choices=KINDS)
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='notifications')
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Fan-out can run twice for the same message without duplicates
+            models.UniqueConstraint(fields=['user', 'message', 'kind'], name='notification_unique'),
+        ]
+        indexes = [
+            # The inbox in keyset order, and its unread part
+            models.Index(fields=['user', '-id'], name='notification_user_id_idx'),
+            models.Index(fields=['user', '-id'], condition=models.Q(is_read=False), name='notification_unread_idx'),
+        ]
+
+
+# Queued side effects of writes (see api.jobs); rows are deleted once done
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Idempotency key: at most one pending job per key
+    key = models.CharField(max_length=200, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    # Until when the worker that claimed it owns it
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=models.Q(status='pending'), name='job_pending_key_unique'),
+        ]
+        indexes = [
+            # What workers claim: pending jobs in run_at order, expired leases
+            models.Index(fields=['run_at', 'id'], condition=models.Q(status='pending'), name='job_ready_idx'),
+            models.Index(fields=['locked_until'], condition=models.Q(status='running'), name='job_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+# Inverted index of live forums per category and tag, as bitmaps of forum
+# ids (bit n set for forum n), maintained by signals (see api.facets)
+class ForumFacet(models.Model):
+    ALL = 'all'
+    CATEGORY = 'category'
+    TAG = 'tag'
+    KINDS = [(ALL, 'All'), (CATEGORY, 'Category'), (TAG, 'Tag')]
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    # Category or tag id, 0 for the bitmap of all live forums
+    value_id = models.PositiveBigIntegerField()
+    bitmap = models.BinaryField(default=bytes)
+    forum_count = models.PositiveIntegerField(default=0)
+    # Changed on every write, on the all-forums row only (see api.facets)
+    revision = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'value_id'], name='forum_facet_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.value_id} ({self.forum_count} forums)'
@@ -0,0 +1,52 @@
+"""
+Notification inbox fan-out.
+
+Saving a message only queues the work (api.jobs); the inbox rows are
+written by the workers after commit, with one insert per batch of
+messages. The unique (user, message, kind) constraint makes running a
+fan-out twice harmless.
+"""
+from .jobs import enqueue, task
+
+
+def notify_mentions(message, user_ids):
+    enqueue(fan_out_mentions, {'message_id': message.pk, 'user_ids': list(user_ids)})
+
+
+def notify_reply(message):
+    enqueue(fan_out_replies, {'message_id': message.pk}, key=f'notifications:reply:{message.pk}')
+
+
+@task('notifications.mentions', batch=True)
+def fan_out_mentions(payloads):
+    """
+    payloads are {'message_id', 'user_ids'} dicts
+    """
+    from .models import Message, Notification
+
+    authors = dict(
+        Message.objects.filter(pk__in=[payload['message_id'] for payload in payloads]).values_list('id', 'user_id')
+    )
+    notifications = [
+        Notification(user_id=user_id, kind=Notification.MENTION, message_id=payload['message_id'],
+                     actor_id=authors[payload['message_id']])
+        for payload in payloads if payload['message_id'] in authors
+        for user_id in payload['user_ids'] if user_id != authors[payload['message_id']]
+    ]
+    return len(Notification.objects.bulk_create(notifications, ignore_conflicts=True))
+
+
+@task('notifications.replies', batch=True)
+def fan_out_replies(payloads):
+    """
+    payloads are {'message_id'} dicts
+    """
+    from .models import Message, Notification
+
+    rows = Message.objects.filter(
+        pk__in=[payload['message_id'] for payload in payloads],
+    ).values_list('id', 'user_id', 'parent__user_id')
+    return len(Notification.objects.bulk_create([
+        Notification(user_id=parent_user_id, kind=Notification.REPLY, message_id=message_id, actor_id=user_id)
+        for message_id, user_id, parent_user_id in rows if parent_user_id not in (None, user_id)
+    ], ignore_conflicts=True))
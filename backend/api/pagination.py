@@ -0,0 +1,309 @@
+import base64
+import binascii
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured, ValidationError
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def get_ordering(queryset, default=('-id',)):
+    """
+    Returns the queryset ordering as (field name, descending) pairs,
+    always ending with the primary key so every position is unique.
+    """
+    order_by = queryset.query.order_by or queryset.model._meta.ordering or default
+    ordering = []
+    for item in order_by:
+        if not isinstance(item, str) or '__' in item or item == '?':
+            raise ImproperlyConfigured(f'Keyset pagination cannot order by {item!r}')
+        descending = item.startswith('-')
+        name = item.lstrip('-')
+        if name == 'pk':
+            name = queryset.model._meta.pk.name
+        ordering.append((name, descending))
+
+    pk_name = queryset.model._meta.pk.name
+    if pk_name not in [name for name, _ in ordering]:
+        ordering.append((pk_name, ordering[0][1] if ordering else True))
+    return ordering
+
+
+def keyset_filter(ordering, values):
+    """
+    Builds the condition for rows strictly after values in ordering, i.e.
+    (a, b) > (x, y) expanded to a > x OR (a = x AND b > y).
+    """
+    condition = None
+    for index, (name, descending) in enumerate(ordering):
+        lookup = {f"{name}__{'lt' if descending else 'gt'}": values[index]}
+        for (prefix, _), value in zip(ordering[:index], values[:index]):
+            lookup[prefix] = value
+        condition = Q(**lookup) if condition is None else condition | Q(**lookup)
+    return condition
+
+
+def order_expressions(ordering, reverse=False):
+    return [f"{'-' if descending != reverse else ''}{name}" for name, descending in ordering]
+
+
+def encode_cursor(model, ordering, obj, reverse=False):
+    if isinstance(obj, dict):
+        # A .values() row (see api.fastpath)
+        obj = model(**{name: obj[name] for name, _ in ordering})
+    # value_to_string keeps full precision (DjangoJSONEncoder drops microseconds)
+    values = [model._meta.get_field(name).value_to_string(obj) for name, _ in ordering]
+    payload = {'o': order_expressions(ordering), 'v': values}
+    if reverse:
+        payload['r'] = 1
+    raw = json.dumps(payload, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(model, ordering, cursor):
+    """
+    Returns (values, reverse) for a cursor, or raises ValueError if it is
+    malformed or was issued for a different ordering.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload['o'] != order_expressions(ordering) or len(payload['v']) != len(ordering):
+            raise ValueError('cursor does not match the ordering')
+        values = [
+            model._meta.get_field(name).to_python(value)
+            for (name, _), value in zip(ordering, payload['v'])
+        ]
+        return values, bool(payload.get('r'))
+    except (TypeError, KeyError, IndexError, FieldDoesNotExist, ValidationError, binascii.Error) as exc:
+        raise ValueError(str(exc))
+
+
+def estimate_count(queryset, limit):
+    """
+    Cheap row count: the planner estimate on PostgreSQL, otherwise an exact
+    count that stops at limit. Returns (count, is_exact).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), False
+
+    count = queryset.order_by()[:limit + 1].count()
+    return min(count, limit), count <= limit
+
+
+async def apaginate_page_number(paginator, queryset, request, view=None):
+    """
+    PageNumberPagination.paginate_queryset with the async ORM
+    """
+    paginator.request = request
+    page_size = paginator.get_page_size(request)
+    if not page_size:
+        return None
+
+    django_paginator = paginator.django_paginator_class(queryset, page_size)
+    # Counted up front, so the page is only sliced, not evaluated
+    django_paginator.count = await queryset.acount()
+    page_number = paginator.get_page_number(request, django_paginator)
+    try:
+        paginator.page = django_paginator.page(page_number)
+    except InvalidPage as exc:
+        msg = paginator.invalid_page_message.format(page_number=page_number, message=str(exc))
+        raise NotFound(msg)
+    paginator.page.object_list = [row async for row in paginator.page.object_list]
+
+    if django_paginator.num_pages > 1 and paginator.template is not None:
+        paginator.display_page_controls = True
+    return list(paginator.page)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on the queryset ordering (e.g. created_at, id).
+
+    Each page is a single indexed range scan, so deep pages cost the same as
+    the first one and no COUNT(*) runs unless the client asks for it with
+    ?count=exact or ?count=estimate.
+
+    Keyset mode is used when the request has a cursor or ?pagination=cursor.
+    Otherwise the request goes to fallback_class, or is left unpaginated
+    when there is none.
+    """
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    estimate_limit = 1000
+    fallback_class = None
+
+    def __init__(self):
+        self.fallback = None
+
+    def wants_keyset(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.wants_keyset(request):
+            if self.fallback_class is None:
+                return None
+            self.fallback = self.fallback_class()
+            return self.fallback.paginate_queryset(queryset, request, view=view)
+
+        count_mode = self.start(queryset, request)
+        if count_mode in ('exact', 'estimate'):
+            self.count, self.count_is_exact = self.count_rows(queryset, count_mode)
+        return self.finish(list(self.page_queryset(queryset)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset with the async ORM, for the async routes
+        """
+        if not self.wants_keyset(request):
+            if self.fallback_class is None:
+                return None
+            self.fallback = self.fallback_class()
+            return await apaginate_page_number(self.fallback, queryset, request, view=view)
+
+        count_mode = self.start(queryset, request)
+        if count_mode in ('exact', 'estimate'):
+            self.count, self.count_is_exact = await self.acount_rows(queryset, count_mode)
+        return self.finish([row async for row in self.page_queryset(queryset)])
+
+    def count_rows(self, queryset, mode):
+        """
+        (count, is_exact) for a ?count= mode, (None, None) for no count
+        """
+        if mode == 'exact':
+            return queryset.count(), True
+        if mode == 'estimate':
+            return estimate_count(queryset, self.estimate_limit)
+        return None, None
+
+    async def acount_rows(self, queryset, mode):
+        if mode == 'exact':
+            return await queryset.acount(), True
+        if mode == 'estimate':
+            return await sync_to_async(estimate_count)(queryset, self.estimate_limit)
+        return None, None
+
+    def state_window(self, queryset, request):
+        """
+        For list validators (see api.conditional): (the rows the requested
+        page is read from, ?count= mode). None when the request isn't
+        paginated or asks for a page by other than its number.
+        """
+        if not self.wants_keyset(request):
+            if self.fallback_class is None:
+                return None
+            fallback = self.fallback_class()
+            page_size = fallback.get_page_size(request)
+            try:
+                number = int(request.query_params.get(fallback.page_query_param, 1))
+            except ValueError:
+                return None
+            if not page_size or number < 1:
+                return None
+            start = (number - 1) * page_size
+            # Page numbers always come with the count
+            return queryset[start:start + page_size], 'exact'
+
+        count_mode = self.start(queryset, request)
+        return self.page_queryset(queryset), count_mode
+
+    def start(self, queryset, request):
+        """
+        Reads the page parameters, returning the ?count= mode
+        """
+        self.request = request
+        self.model = queryset.model
+        self.ordering = get_ordering(queryset)
+        self.page_size = self.get_page_size(request)
+        self.count = None
+        self.cursor = request.query_params.get(self.cursor_query_param)
+        self.reverse = False
+        self.values = None
+        if self.cursor:
+            try:
+                self.values, self.reverse = decode_cursor(self.model, self.ordering, self.cursor)
+            except ValueError:
+                raise NotFound('Invalid cursor')
+        return request.query_params.get(self.count_query_param)
+
+    def page_queryset(self, queryset):
+        if self.cursor:
+            queryset = queryset.filter(keyset_filter(
+                [(name, descending != self.reverse) for name, descending in self.ordering], self.values
+            ))
+        return queryset.order_by(*order_expressions(self.ordering, self.reverse))[:self.page_size + 1]
+
+    def finish(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if rows:
+            if has_more or self.reverse:
+                self.next_cursor = encode_cursor(self.model, self.ordering, rows[-1])
+            if (self.cursor and not self.reverse) or (self.reverse and has_more):
+                self.previous_cursor = encode_cursor(self.model, self.ordering, rows[0], reverse=True)
+        return rows
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+
+        payload = {
+            'next': self.get_link(self.next_cursor),
+            'previous': self.get_link(self.previous_cursor),
+        }
+        if self.count is not None:
+            payload['count'] = self.count
+            payload['count_is_exact'] = self.count_is_exact
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'count_is_exact': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
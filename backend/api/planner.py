@@ -0,0 +1,66 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+def plan_relations(serializer, model, prefix='', in_prefetch=False):
+    """
+    Walks the readable fields of serializer and returns the
+    (select_related, prefetch_related) lookups needed to render it without
+    one query per row.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+
+    select, prefetch = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*' or '.' in field.source:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+
+        lookup = prefix + field.source
+        to_many = model_field.many_to_many or model_field.one_to_many
+
+        if to_many:
+            # Even plain primary key lists need the through rows
+            prefetch.append(lookup)
+        elif isinstance(field, serializers.BaseSerializer):
+            (prefetch if in_prefetch else select).append(lookup)
+        else:
+            # PrimaryKeyRelatedField on a forward key reads the *_id column
+            continue
+
+        if isinstance(field, serializers.BaseSerializer):
+            # Relations below a prefetch have to be prefetched as well
+            child_select, child_prefetch = plan_relations(
+                field, model_field.related_model, lookup + '__', in_prefetch or to_many
+            )
+            select.extend(child_select)
+            prefetch.extend(child_prefetch)
+
+    return select, prefetch
+
+
+def plan_queryset(queryset, serializer):
+    select, prefetch = plan_relations(serializer, queryset.model)
+    if select:
+        queryset = queryset.select_related(*dict.fromkeys(select))
+    if prefetch:
+        queryset = queryset.prefetch_related(*dict.fromkeys(prefetch))
+    return queryset
+
+
+class QueryPlannerMixin:
+    """
+    Adds the joins and prefetches the view's serializer needs to every
+    queryset it reads, based on the fields actually being rendered
+    (including a ?fields= subset).
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return plan_queryset(queryset, self.get_serializer())
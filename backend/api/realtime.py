@@ -0,0 +1,217 @@
+import asyncio
+import json
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+def forum_group(forum_id):
+    return f'forum.{forum_id}'
+
+
+def user_group(user_id):
+    return f'user.{user_id}'
+
+
+class Subscription:
+    """
+    One connection's view of the broker: a queue of events for the groups
+    it is subscribed to
+    """
+
+    def __init__(self, broker, groups):
+        self.broker = broker
+        self.groups = set(groups)
+
+    async def get(self):
+        raise NotImplementedError
+
+    async def add(self, group):
+        raise NotImplementedError
+
+    async def discard(self, group):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+
+class InProcessSubscription(Subscription):
+
+    def __init__(self, broker, groups, max_pending):
+        super().__init__(broker, groups)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.dropped = 0
+
+    def deliver(self, event):
+        # Runs on the subscriber's event loop; a client that can't keep up
+        # loses events rather than growing memory without bound
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def get(self):
+        return await self.queue.get()
+
+    async def add(self, group):
+        self.broker.attach(self, [group])
+
+    async def discard(self, group):
+        self.broker.detach(self, [group])
+
+    async def close(self):
+        self.broker.detach(self, list(self.groups))
+
+
+class InProcessBroker:
+    """
+    Fan-out between the threads and event loops of a single process. Good
+    for runserver, tests and single-node ASGI deployments.
+    """
+    # Events published by other processes (e.g. run_jobs) never get here
+    shared = False
+
+    def __init__(self, max_pending=1000):
+        self.max_pending = max_pending
+        self.groups = {}
+        self.lock = threading.Lock()
+
+    def attach(self, subscription, groups):
+        with self.lock:
+            for group in groups:
+                self.groups.setdefault(group, set()).add(subscription)
+                subscription.groups.add(group)
+
+    def detach(self, subscription, groups):
+        with self.lock:
+            for group in groups:
+                members = self.groups.get(group)
+                if members is not None:
+                    members.discard(subscription)
+                    if not members:
+                        del self.groups[group]
+                subscription.groups.discard(group)
+
+    async def subscribe(self, groups):
+        subscription = InProcessSubscription(self, (), self.max_pending)
+        self.attach(subscription, groups)
+        return subscription
+
+    def publish(self, group, event):
+        """
+        Thread-safe; may be called from sync request handlers
+        """
+        with self.lock:
+            subscriptions = list(self.groups.get(group, ()))
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+
+
+class RedisSubscription(Subscription):
+
+    def __init__(self, broker, groups, pubsub):
+        super().__init__(broker, groups)
+        self.pubsub = pubsub
+
+    async def get(self):
+        while True:
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            if message is not None and message['type'] == 'message':
+                return json.loads(message['data'])
+
+    async def add(self, group):
+        await self.pubsub.subscribe(self.broker.channel(group))
+        self.groups.add(group)
+
+    async def discard(self, group):
+        await self.pubsub.unsubscribe(self.broker.channel(group))
+        self.groups.discard(group)
+
+    async def close(self):
+        await self.pubsub.aclose()
+
+
+class RedisBroker:
+    """
+    Redis pub/sub, for fan-out across several ASGI workers or hosts.
+    Needs the redis package.
+    """
+    shared = True
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='forum-events:'):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured('RedisBroker requires the redis package')
+        self.url = url
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self.async_client = redis.asyncio.Redis.from_url(url)
+
+    def channel(self, group):
+        return self.prefix + group
+
+    async def subscribe(self, groups):
+        pubsub = self.async_client.pubsub()
+        if groups:
+            await pubsub.subscribe(*[self.channel(group) for group in groups])
+        return RedisSubscription(self, groups, pubsub)
+
+    def publish(self, group, event):
+        self.client.publish(self.channel(group), json.dumps(event, cls=DjangoJSONEncoder))
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """
+    The broker from settings.API_REALTIME_BROKER, created once per process
+    """
+    path = getattr(settings, 'API_REALTIME_BROKER', 'api.realtime.InProcessBroker')
+    options = getattr(settings, 'API_REALTIME_BROKER_OPTIONS', {})
+    return import_string(path)(**options)
+
+
+def publish_after_commit(group, build_event):
+    """
+    Publishes build_event() once the current transaction commits, so clients
+    never hear about rows they can't read yet. The event is built at commit
+    time, after save() has finished with the instance.
+    """
+    def publish():
+        # Round-trip through JSON so every broker sees the same plain data
+        event = json.loads(json.dumps(build_event(), cls=DjangoJSONEncoder))
+        get_broker().publish(group, event)
+
+    transaction.on_commit(publish)
+
+
+def message_event(action, message):
+    from .serializers import MessageSerializer
+
+    if action == 'deleted':
+        # Captured now: delete() clears the primary key before commit
+        deleted = {'id': message.pk, 'forum': message.forum_id, 'parent': message.parent_id}
+
+    def build():
+        data = deleted if action == 'deleted' else MessageSerializer(message).data
+        return {'type': f'message.{action}', 'forum_id': message.forum_id, 'message': data}
+
+    publish_after_commit(forum_group(message.forum_id), build)
+
+
+def mention_events(message, user_ids):
+    for user_id in user_ids:
+        publish_after_commit(user_group(user_id), lambda: {
+            'type': 'mention.created',
+            'forum_id': message.forum_id,
+            'message_id': message.pk,
+            'user_id': message.user_id,
+        })
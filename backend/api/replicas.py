@@ -0,0 +1,118 @@
+import contextvars
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+# Set by ReplicaRoutingMiddleware for the duration of each request
+routing = contextvars.ContextVar('api_replica_routing', default=None)
+
+# Holds the time until which a client's reads stay on the primary
+PIN_COOKIE = 'api_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def read_replicas():
+    return getattr(settings, 'API_READ_REPLICAS', [])
+
+
+class RoutingState:
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+class ReplicaRouter:
+    """
+    Sends reads to a random replica while the current request allows it,
+    and everything else to the primary ('default'). The first write of a
+    request moves its remaining reads to the primary as well.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = routing.get()
+        aliases = read_replicas()
+        if state is None or not state.use_replica or not aliases:
+            return None
+        if connections['default'].in_atomic_block:
+            # Reads inside a transaction belong with its writes
+            return 'default'
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        state = routing.get()
+        if state is not None:
+            state.use_replica = False
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {'default', *read_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in read_replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets safe requests to the api read from replicas. After a request that
+    wrote, the client gets a cookie keeping its reads on the primary for
+    API_REPLICA_PIN_SECONDS, so it reads its own writes despite replica lag.
+    """
+    path_prefix = '/api/'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Runs natively under ASGI, so async views stay off worker threads
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def pinned(self, request):
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def start(self, request):
+        return RoutingState(
+            request.method in SAFE_METHODS
+            and request.path.startswith(self.path_prefix)
+            and not self.pinned(request)
+        )
+
+    def finish(self, state, response):
+        if state.wrote and read_replicas():
+            seconds = getattr(settings, 'API_REPLICA_PIN_SECONDS', 5)
+            response.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=seconds, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = self.start(request)
+        token = routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        state = self.start(request)
+        token = routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing.reset(token)
+        return self.finish(state, response)
@@ -0,0 +1,332 @@
+import html
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .jobs import enqueue, task
+
+FORUM = 'forum'
+MESSAGE = 'message'
+KINDS = (FORUM, MESSAGE)
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+# What the backends wrap matches in; swapped for the tags above once the
+# indexed text around them is escaped (private use characters, so text
+# can't fake them in practice)
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def to_html(text):
+    """
+    text, with matches wrapped in MATCH_START/MATCH_END, as HTML: escaped,
+    with the matches in <mark> tags. Forum names and messages are user
+    input, so hits must never carry their markup.
+    """
+    return html.escape(text or '').replace(MATCH_START, HIGHLIGHT_START).replace(MATCH_END, HIGHLIGHT_END)
+
+
+def mark_terms(text, terms):
+    """
+    Wraps the words of text starting with one of terms (case-insensitive)
+    in MATCH_START/MATCH_END, for backends without highlighting
+    """
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\w*', re.IGNORECASE)
+    return pattern.sub(lambda match: MATCH_START + match.group(0) + MATCH_END, text or '')
+
+
+def document_id(kind, object_id):
+    """
+    Forums and messages share one index; their ids are interleaved so each
+    document has a stable integer key that can be replaced in place.
+    """
+    return object_id * 2 + KINDS.index(kind)
+
+
+def forum_document(forum):
+    return {'title': forum.name, 'body': forum.description, 'forum_id': forum.pk}
+
+
+def message_document(message):
+    return {'title': '', 'body': message.content, 'forum_id': message.forum_id}
+
+
+class SearchBackend:
+    """
+    Keeps an inverted index of forum names/descriptions and message content.
+
+    Hits are dicts with kind, id, forum_id, rank (lower is better),
+    title and snippet. Title and snippet are HTML: the indexed text
+    escaped, with matched terms wrapped in <mark> tags (see to_html).
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def index(self, kind, object_id, document):
+        raise NotImplementedError
+
+    def remove(self, kind, object_id):
+        raise NotImplementedError
+
+    def search(self, query, kind=None, forum_id=None, limit=20, offset=0):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def index_forum(self, forum):
+        if forum.is_deleted:
+            self.remove(FORUM, forum.pk)
+        else:
+            self.index(FORUM, forum.pk, forum_document(forum))
+
+    def index_message(self, message):
+        self.index(MESSAGE, message.pk, message_document(message))
+
+    def index_many(self, kind, documents):
+        """
+        documents is an iterable of (object_id, document) pairs
+        """
+        for object_id, document in documents:
+            self.index(kind, object_id, document)
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    SQLite FTS5 table ranked with bm25; see migration 0006_search_index
+    """
+    table = 'api_search_fts'
+
+    def index(self, kind, object_id, document):
+        self.index_many(kind, [(object_id, document)])
+
+    def index_many(self, kind, documents):
+        rows = [
+            (document_id(kind, object_id), document['title'], document['body'], kind, object_id, document['forum_id'])
+            for object_id, document in documents
+        ]
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {self.table} (rowid, title, body, kind, object_id, forum_id) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove(self, kind, object_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [document_id(kind, object_id)])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def match_expression(self, query):
+        # Quote every term so user input can't inject FTS5 syntax; the last
+        # term matches as a prefix for search-as-you-type
+        terms = TOKEN_RE.findall(query)
+        if not terms:
+            return None
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, query, kind=None, forum_id=None, limit=20, offset=0):
+        expression = self.match_expression(query)
+        if expression is None:
+            return []
+
+        sql = [
+            f"SELECT s.kind, s.object_id, s.forum_id, bm25({self.table}, 2.0, 1.0) AS rank,",
+            f"highlight({self.table}, 0, %s, %s), snippet({self.table}, 1, %s, %s, '…', 16)",
+            f'FROM {self.table} AS s JOIN api_forum AS f ON f.id = s.forum_id',
+            f'WHERE {self.table} MATCH %s AND f.is_deleted = %s',
+        ]
+        params = [MATCH_START, MATCH_END, MATCH_START, MATCH_END, expression, False]
+        if kind:
+            sql.append('AND s.kind = %s')
+            params.append(kind)
+        if forum_id:
+            sql.append('AND s.forum_id = %s')
+            params.append(forum_id)
+        sql.append('ORDER BY rank LIMIT %s OFFSET %s')
+        params += [limit, offset]
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            return [
+                {'kind': row[0], 'id': row[1], 'forum_id': row[2], 'rank': row[3],
+                 'title': to_html(row[4]), 'snippet': to_html(row[5])}
+                for row in cursor.fetchall()
+            ]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Table with a generated, GIN-indexed tsvector column; see migration
+    0006_search_index
+    """
+    table = 'api_search_document'
+    config = 'english'
+
+    def index(self, kind, object_id, document):
+        self.index_many(kind, [(object_id, document)])
+
+    def index_many(self, kind, documents):
+        rows = [
+            (document_id(kind, object_id), kind, object_id, document['forum_id'], document['title'], document['body'])
+            for object_id, document in documents
+        ]
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (id, kind, object_id, forum_id, title, body) '
+                'VALUES (%s, %s, %s, %s, %s, %s) '
+                'ON CONFLICT (id) DO UPDATE SET forum_id = EXCLUDED.forum_id, '
+                'title = EXCLUDED.title, body = EXCLUDED.body',
+                rows,
+            )
+
+    def remove(self, kind, object_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE id = %s', [document_id(kind, object_id)])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {self.table}')
+
+    def search(self, query, kind=None, forum_id=None, limit=20, offset=0):
+        if not TOKEN_RE.search(query):
+            return []
+
+        options = f'StartSel="{MATCH_START}", StopSel="{MATCH_END}", MaxWords=32, MinWords=8'
+        sql = [
+            'WITH q AS (SELECT websearch_to_tsquery(%s::regconfig, %s) AS query)',
+            'SELECT s.kind, s.object_id, s.forum_id, -ts_rank_cd(s.document, q.query) AS rank,',
+            'ts_headline(%s::regconfig, s.title, q.query, %s), ts_headline(%s::regconfig, s.body, q.query, %s)',
+            f'FROM {self.table} AS s JOIN api_forum AS f ON f.id = s.forum_id, q',
+            'WHERE s.document @@ q.query AND f.is_deleted = false',
+        ]
+        params = [self.config, query, self.config, options, self.config, options]
+        if kind:
+            sql.append('AND s.kind = %s')
+            params.append(kind)
+        if forum_id:
+            sql.append('AND s.forum_id = %s')
+            params.append(forum_id)
+        sql.append('ORDER BY rank LIMIT %s OFFSET %s')
+        params += [limit, offset]
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            return [
+                {'kind': row[0], 'id': row[1], 'forum_id': row[2], 'rank': row[3],
+                 'title': to_html(row[4]), 'snippet': to_html(row[5])}
+                for row in cursor.fetchall()
+            ]
+
+
+class BasicSearchBackend(SearchBackend):
+    """
+    Fallback for databases without a full-text index: no index to maintain,
+    searches with icontains table scans.
+    """
+
+    def index(self, kind, object_id, document):
+        pass
+
+    def remove(self, kind, object_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, kind=None, forum_id=None, limit=20, offset=0):
+        from .models import Forum, Message
+
+        terms = TOKEN_RE.findall(query)
+        if not terms:
+            return []
+
+        hits = []
+        if kind in (None, FORUM):
+            forums = Forum.objects.using(self.using).filter(is_deleted=False)
+            if forum_id:
+                forums = forums.filter(pk=forum_id)
+            for term in terms:
+                forums = forums.filter(Q(name__icontains=term) | Q(description__icontains=term))
+            hits += [
+                {'kind': FORUM, 'id': forum.pk, 'forum_id': forum.pk, 'rank': 0,
+                 'title': to_html(mark_terms(forum.name, terms)), 'snippet': to_html(mark_terms(forum.description, terms))}
+                for forum in forums.order_by('-id')[:offset + limit]
+            ]
+        if kind in (None, MESSAGE):
+            messages = Message.objects.using(self.using).filter(forum__is_deleted=False)
+            if forum_id:
+                messages = messages.filter(forum_id=forum_id)
+            for term in terms:
+                messages = messages.filter(content__icontains=term)
+            hits += [
+                {'kind': MESSAGE, 'id': message.pk, 'forum_id': message.forum_id, 'rank': 0,
+                 'title': '', 'snippet': to_html(mark_terms(message.content, terms))}
+                for message in messages.order_by('-id')[:offset + limit]
+            ]
+        return hits[offset:offset + limit]
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using='default'):
+    """
+    Returns the search backend from settings.API_SEARCH_BACKEND, or the
+    best one for the database vendor
+    """
+    path = getattr(settings, 'API_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)(using)
+    return VENDOR_BACKENDS.get(connections[using].vendor, BasicSearchBackend)(using)
+
+
+def queue_reindex(kind, object_id):
+    """
+    Queues the (re)indexing of a forum or message, or its removal from the
+    index if it's gone by the time the job runs
+    """
+    enqueue(reindex, {'kind': kind, 'id': object_id}, key=f'search:{kind}:{object_id}')
+
+
+@task('search.reindex', batch=True)
+def reindex(payloads):
+    """
+    payloads are {'kind', 'id'} dicts; each kind is read with one query
+    and written with one index_many()
+    """
+    from .models import Forum, Message
+
+    backend = get_backend()
+    querysets = {
+        FORUM: (Forum.objects.filter(is_deleted=False), forum_document),
+        MESSAGE: (Message.objects.only('id', 'forum_id', 'content'), message_document),
+    }
+    for kind, (queryset, to_document) in querysets.items():
+        ids = {payload['id'] for payload in payloads if payload['kind'] == kind}
+        if not ids:
+            continue
+        found = list(queryset.filter(pk__in=ids))
+        if found:
+            backend.index_many(kind, [(obj.pk, to_document(obj)) for obj in found])
+        for object_id in ids - {obj.pk for obj in found}:
+            backend.remove(kind, object_id)
@@ -0,0 +1,191 @@
+"""
+Synthetic forum data for benchmarks (see the seed_forum_data and
+benchmark_api commands).
+
+The same options and seed always give the same data. Everything is
+written with bulk inserts; messages go through the archive Importer, so
+thread paths, mentions, the search index and the counters come out as if
+the messages had been imported.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import facets
+from .archive import Importer, isoformat
+from .caching import bump_version
+from .mentions import forget_name
+from .models import Category, Forum, ForumMembership, Message, Tag
+from .search import FORUM, forum_document, get_backend
+
+# Password of every seeded user, for login benchmarks
+PASSWORD = 'benchmark'
+
+WORDS = (
+    'latency throughput index query cache thread reply forum post answer question '
+    'database python django request response server client socket memory disk '
+    'benchmark profile trace metric counter histogram release deploy rollback '
+    'feature bug patch review merge branch commit build test pipeline worker'
+).split()
+
+# Shares of new messages that start a thread, and that answer the newest
+# message (making long reply chains) rather than a random earlier one
+ROOT_RATE = 0.1
+CHAIN_RATE = 0.6
+
+
+class Seeder:
+
+    def __init__(self, prefix='seed', seed=0, batch_size=2000, progress=None):
+        self.prefix = prefix
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.progress = progress
+        self.counts = {}
+
+    def run(self, users=200, forums=20, messages=500, categories=5, tags=20, tags_per_forum=3,
+            memberships=5, max_depth=20, mention_rate=0.1, days=30):
+        """
+        Creates users, categories and tags, then forums with memberships
+        (per user) and messages (per forum). Returns the counts.
+        """
+        User = get_user_model()
+        if User.objects.filter(email__startswith=f'{self.prefix}-user-').exists():
+            raise ValueError(f'Users prefixed {self.prefix!r} already exist; use another prefix')
+
+        with transaction.atomic():
+            people = self.create_users(users)
+            category_ids, tag_ids = self.create_taxonomy(categories, tags)
+            forum_list = self.create_forums(forums, people, category_ids, tag_ids, tags_per_forum)
+            self.create_memberships(people, forum_list, memberships)
+
+        started = timezone.now() - timedelta(days=days)
+        for forum in forum_list:
+            self.create_messages(forum, people, messages, max_depth, mention_rate, started, days)
+            if self.progress:
+                self.progress(self)
+        self.mark_read(forum_list)
+        return self.counts
+
+    def add(self, name, count):
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def create_users(self, count):
+        User = get_user_model()
+        # One hash for everyone: hashing is slow on purpose
+        password = make_password(PASSWORD)
+        users = User.objects.bulk_create([
+            User(email=f'{self.prefix}-user-{number}@example.com', name=f'{self.prefix}_user_{number}', password=password)
+            for number in range(count)
+        ], batch_size=self.batch_size)
+        # bulk_create skips the signals that keep these caches fresh
+        for user in users:
+            forget_name(user.name)
+        bump_version('users')
+        self.add('users', len(users))
+        return users
+
+    def create_taxonomy(self, categories, tags):
+        category_ids = [
+            category.pk for category in Category.objects.bulk_create(
+                [Category(name=f'{self.prefix}-category-{number}') for number in range(categories)]
+            )
+        ]
+        tag_ids = [
+            tag.pk for tag in Tag.objects.bulk_create([Tag(name=f'{self.prefix}-tag-{number}') for number in range(tags)])
+        ]
+        bump_version('categories')
+        bump_version('tags')
+        self.add('categories', len(category_ids))
+        self.add('tags', len(tag_ids))
+        return category_ids, tag_ids
+
+    def words(self, count):
+        return ' '.join(self.random.choice(WORDS) for _ in range(count))
+
+    def create_forums(self, count, users, category_ids, tag_ids, tags_per_forum):
+        forums = Forum.objects.bulk_create([
+            Forum(
+                name=f'{self.prefix} forum {number}: {self.words(3)}',
+                description=self.words(self.random.randint(5, 30)),
+                category_id=self.random.choice(category_ids) if category_ids else None,
+                created_by=self.random.choice(users),
+                is_locked=self.random.random() < 0.05,
+            )
+            for number in range(count)
+        ], batch_size=self.batch_size)
+        links = [
+            Forum.tags.through(forum_id=forum.pk, tag_id=tag_id)
+            for forum in forums
+            for tag_id in self.random.sample(tag_ids, min(tags_per_forum, len(tag_ids)))
+        ]
+        Forum.tags.through.objects.bulk_create(links, batch_size=self.batch_size)
+        get_backend().index_many(FORUM, [(forum.pk, forum_document(forum)) for forum in forums])
+        # Nor do the facet bitmaps get the forums and their tags
+        facets.rebuild()
+        bump_version('forums')
+        self.add('forums', len(forums))
+        return forums
+
+    def create_memberships(self, users, forums, per_user):
+        memberships = [
+            ForumMembership(user=user, forum=forum)
+            for user in users
+            for forum in self.random.sample(forums, min(per_user, len(forums)))
+        ]
+        ForumMembership.objects.bulk_create(memberships, batch_size=self.batch_size)
+        self.add('memberships', len(memberships))
+
+    def message_rows(self, count, users, max_depth, mention_rate, started, days):
+        """
+        Archive rows (see api.archive) for count messages in thread order
+        """
+        step = timedelta(days=days) / max(count, 1)
+        depths = {}
+        for number in range(1, count + 1):
+            roll = self.random.random()
+            parent = None
+            if number > 1 and roll >= ROOT_RATE:
+                parent = number - 1 if roll < ROOT_RATE + CHAIN_RATE else self.random.randint(1, number - 1)
+                if depths[parent] >= max_depth:
+                    parent = None
+            depths[number] = depths[parent] + 1 if parent else 0
+
+            content = self.words(self.random.randint(3, 40))
+            if self.random.random() < mention_rate:
+                content += f' @{self.random.choice(users).name}'
+            yield {
+                'id': number,
+                'parent': parent,
+                'user': self.random.choice(users).email,
+                'content': content,
+                'created_at': isoformat(started + step * number),
+            }
+
+    def create_messages(self, forum, users, count, max_depth, mention_rate, started, days):
+        importer = Importer(forum=forum, batch_size=self.batch_size)
+        importer.run(self.message_rows(count, users, max_depth, mention_rate, started, days))
+        self.add('messages', importer.imported)
+        self.add('mentions', importer.mentions)
+
+    def mark_read(self, forums):
+        """
+        Moves the read markers of about half the memberships somewhere into
+        their forum, so unread counts vary
+        """
+        memberships = list(ForumMembership.objects.filter(forum__in=forums).order_by('id'))
+        message_ids = {}
+        for forum_id, message_id in Message.objects.filter(forum__in=forums).values_list('forum_id', 'id'):
+            message_ids.setdefault(forum_id, []).append(message_id)
+        changed = []
+        for membership in memberships:
+            ids = message_ids.get(membership.forum_id)
+            if ids and self.random.random() < 0.5:
+                membership.last_read_message_id = self.random.choice(ids)
+                membership.last_read_at = timezone.now()
+                changed.append(membership)
+        ForumMembership.objects.bulk_update(changed, ['last_read_message_id', 'last_read_at'], batch_size=self.batch_size)
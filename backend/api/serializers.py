@@ -1,8 +1,28 @@
 from rest_framework import serializers
 from . import models
+from .metrics import TimedMixin
 from myauth.serializers import NestedUserSerializer
+from .tree import check_parent
 
-class CategorySerializer(serializers.ModelSerializer):
+
+class SparseFieldsMixin:
+    """
+    Lets read requests ask for a subset of fields with ?fields=id,name
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        requested = request.query_params.get('fields')
+        if requested:
+            keep = {name.strip() for name in requested.split(',')}
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+
+
+class CategorySerializer(TimedMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Category
         fields = '__all__'
@@ -10,12 +30,12 @@ class CategorySerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         return models.Category.objects.create(**validated_data)
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Tag
         fields = '__all__'
         
-class ForumSerializer(serializers.ModelSerializer):
+class ForumSerializer(TimedMixin, SparseFieldsMixin, serializers.ModelSerializer):
     # Read-only nested representations
     category_detail = CategorySerializer(source='category', read_only=True)
     tags_detail = TagSerializer(source='tags', many=True, read_only=True)
@@ -43,12 +63,15 @@ class ForumSerializer(serializers.ModelSerializer):
             'is_locked',
             'is_deleted',
             'created_at',
-            'updated_at'
+            'updated_at',
+            'member_count',
+            'message_count',
+            'last_activity_at',
         ]
         read_only_fields = ['created_by', 'created_at', 'updated_at']
 
     
-class ForumMembershipSerializer(serializers.ModelSerializer):
+class ForumMembershipSerializer(TimedMixin, SparseFieldsMixin, serializers.ModelSerializer):
     
     user = NestedUserSerializer(read_only=True)
     class Meta:
@@ -56,13 +79,40 @@ class ForumMembershipSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['joined_at', 'user']
         
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(TimedMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Message
-        fields = '__all__'
+        exclude = ['path']
         read_only_fields = ['created_at', 'updated_at', 'user']
+
+    def validate_parent(self, parent):
+        try:
+            check_parent(self.instance or models.Message(), parent)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+        return parent
+
+
+class ThreadMessageSerializer(MessageSerializer):
+    reply_count = serializers.IntegerField(read_only=True)
         
-class MessageMentionSerializer(serializers.ModelSerializer):
+class MessageMentionSerializer(TimedMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = models.MessageMention
         fields = '__all__'
+
+
+class NotificationMessageSerializer(TimedMixin, serializers.ModelSerializer):
+    class Meta:
+        model = models.Message
+        fields = ['id', 'forum', 'parent', 'content', 'created_at']
+
+
+class NotificationSerializer(TimedMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    message = NotificationMessageSerializer(read_only=True)
+    actor = NestedUserSerializer(read_only=True)
+
+    class Meta:
+        model = models.Notification
+        fields = ['id', 'kind', 'message', 'actor', 'is_read', 'created_at']
+        read_only_fields = fields
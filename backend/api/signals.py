@@ -0,0 +1,117 @@
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import facets, metrics
+from .caching import bump_version
+from .mentions import forget_name
+from .models import Category, Forum, Message, Tag
+from .realtime import message_event
+from .search import FORUM, MESSAGE, queue_reindex
+
+
+@receiver(pre_save, sender=get_user_model())
+def remember_mention_name(sender, instance, update_fields=None, **kwargs):
+    """
+    Keeps the name a user is saved over, so a rename forgets the old
+    @name too
+    """
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and 'name' not in update_fields:
+        return
+    instance._previous_name = sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_mention_name(sender, instance, **kwargs):
+    """
+    Keep the cached @name lookup and the cached forum lists (which embed
+    the creator) in sync with user records
+    """
+    forget_name(instance.name)
+    previous = instance.__dict__.pop('_previous_name', None)
+    if previous != instance.name:
+        forget_name(previous)
+    bump_version('users')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories(sender, **kwargs):
+    bump_version('categories')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    bump_version('tags')
+
+
+@receiver(post_save, sender=Forum)
+@receiver(post_delete, sender=Forum)
+@receiver(m2m_changed, sender=Forum.tags.through)
+def invalidate_forums(sender, **kwargs):
+    bump_version('forums')
+
+
+@receiver(post_save, sender=Forum)
+@receiver(post_delete, sender=Forum)
+def index_forum(sender, instance, **kwargs):
+    queue_reindex(FORUM, instance.pk)
+
+
+@receiver(post_save, sender=Forum)
+def update_forum_facets(sender, instance, created, update_fields=None, **kwargs):
+    # update_fields may name fields by attname (category_id) too
+    fields = None if update_fields is None else {sender._meta.get_field(name).name for name in update_fields}
+    if fields is None or {'category', 'is_deleted'} & fields:
+        facets.forum_saved(instance, created)
+
+
+@receiver(post_delete, sender=Forum)
+def remove_forum_facets(sender, instance, **kwargs):
+    facets.forum_deleted(instance.pk)
+
+
+@receiver(m2m_changed, sender=Forum.tags.through)
+def update_tag_facets(sender, instance, action, reverse, pk_set, **kwargs):
+    facets.tags_changed(instance, action, reverse, pk_set)
+
+
+@receiver(post_delete, sender=Category)
+def drop_category_facet(sender, instance, **kwargs):
+    facets.drop('category', instance.pk)
+
+
+@receiver(post_delete, sender=Tag)
+def drop_tag_facet(sender, instance, **kwargs):
+    facets.drop('tag', instance.pk)
+
+
+@receiver(post_save, sender=Message)
+def index_message(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'content' in update_fields or 'forum' in update_fields:
+        queue_reindex(MESSAGE, instance.pk)
+
+
+@receiver(post_delete, sender=Message)
+def unindex_message(sender, instance, **kwargs):
+    queue_reindex(MESSAGE, instance.pk)
+
+
+@receiver(post_save, sender=Message)
+def publish_message(sender, instance, created, **kwargs):
+    message_event('created' if created else 'updated', instance)
+
+
+@receiver(post_delete, sender=Message)
+def publish_message_deleted(sender, instance, **kwargs):
+    message_event('deleted', instance)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    metrics.instrument(connection)
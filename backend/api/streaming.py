@@ -0,0 +1,85 @@
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+# ?stream= values and their content types
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def chunk_size():
+    """
+    Rows fetched from the database and rendered per yielded chunk
+    """
+    return getattr(settings, 'API_STREAM_CHUNK_SIZE', 500)
+
+
+def stream_format(request):
+    """
+    Returns 'json' or 'ndjson' when the request asked for a streamed list
+    with ?stream=, otherwise None
+    """
+    fmt = request.query_params.get('stream')
+    return fmt if fmt in STREAM_FORMATS else None
+
+
+def dumps(data):
+    # Same output as DRF's JSONRenderer in compact mode
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def render_rows(queryset, serializer, fmt, size):
+    """
+    Yields the queryset rendered as one JSON array or as NDJSON lines,
+    keeping only one chunk of rows in memory at a time
+    """
+    rows = queryset.iterator(chunk_size=size)
+    if fmt == 'json':
+        # Sent before the query runs so clients see the first byte right away
+        yield b'['
+    first = True
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            break
+        items = [dumps(serializer.to_representation(row)) for row in chunk]
+        if fmt == 'ndjson':
+            yield ('\n'.join(items) + '\n').encode()
+        else:
+            yield (('' if first else ',') + ','.join(items)).encode()
+        first = False
+    if fmt == 'json':
+        yield b']'
+
+
+def streaming_response(queryset, serializer, fmt):
+    """
+    Streams the queryset through serializer, a single (not many=True)
+    serializer instance reused for every row
+    """
+    response = StreamingHttpResponse(
+        render_rows(queryset, serializer, fmt, chunk_size()),
+        content_type=STREAM_FORMATS[fmt],
+    )
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class StreamingListMixin:
+    """
+    Unpaginated list routes stream the whole filtered queryset with
+    ?stream=json (a JSON array) or ?stream=ndjson (one object per line)
+    instead of building the full list and JSON string in memory.
+    """
+
+    def list(self, request, *args, **kwargs):
+        fmt = stream_format(request)
+        if fmt is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return streaming_response(queryset, self.get_serializer(), fmt)
@@ -0,0 +1,78 @@
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr
+
+# Every message id becomes a fixed-width base 36 segment of its path, so
+# sorting by path gives depth-first thread order and a subtree is a prefix
+# range scan. Eight characters cover ids up to 36**8 (~2.8 trillion).
+PATH_STEP = 8
+PATH_MAX_LENGTH = 1024
+MAX_DEPTH = PATH_MAX_LENGTH // PATH_STEP - 1
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def path_segment(pk):
+    segment = ''
+    while pk:
+        pk, remainder = divmod(pk, 36)
+        segment = DIGITS[remainder] + segment
+    return segment.rjust(PATH_STEP, '0')
+
+
+def next_path(path):
+    """
+    Returns the smallest path of the same length that sorts after path and
+    all its descendants, or None if there is none
+    """
+    digits = list(path)
+    for index in range(len(digits) - 1, -1, -1):
+        position = DIGITS.index(digits[index])
+        if position < len(DIGITS) - 1:
+            digits[index] = DIGITS[position + 1]
+            return ''.join(digits[:index + 1]) + '0' * (len(digits) - index - 1)
+    return None
+
+
+def subtree(path):
+    """
+    Filter for a message and all its replies. A range rather than
+    path__startswith, since SQLite can't use an index for LIKE 'prefix%'.
+    """
+    condition = Q(path__gte=path)
+    upper = next_path(path)
+    if upper is not None:
+        condition &= Q(path__lt=upper)
+    return condition
+
+
+def check_parent(message, parent):
+    """
+    Raises ValueError if message can't be a reply to parent
+    """
+    if parent is None:
+        return
+    if parent.depth >= MAX_DEPTH:
+        raise ValueError(f'Threads are limited to {MAX_DEPTH} levels of replies')
+    if message.pk is not None and message.path and parent.path.startswith(message.path):
+        raise ValueError('A message cannot become a reply to itself or its own replies')
+
+
+def path_for(message):
+    """
+    Returns (path, depth) for a saved message, using its parent's path
+    """
+    parent = message.parent
+    if parent is None:
+        return path_segment(message.pk), 0
+    return parent.path + path_segment(message.pk), parent.depth + 1
+
+
+def move_subtree(queryset, old_path, old_depth, new_path, new_depth):
+    """
+    Rewrites the paths of a message and all its replies after it moved to
+    another parent, in one UPDATE.
+    """
+    return queryset.filter(subtree(old_path)).update(
+        path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+        depth=F('depth') + (new_depth - old_depth),
+    )
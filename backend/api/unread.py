@@ -0,0 +1,85 @@
+"""
+Unread messages per forum, from the read marker on each ForumMembership.
+
+Message ids only grow, so a member's unread messages are those of the forum
+with an id above last_read_message_id: a range scan of the (forum, id)
+index that only touches unread rows. Counting stops after
+API_UNREAD_COUNT_LIMIT, so a forum left unread for months costs no more
+than a busy one.
+"""
+from django.conf import settings
+from django.db.models import IntegerField, OuterRef, Subquery
+from django.db.models.functions import Least
+from django.utils import timezone
+
+
+class SubqueryCount(Subquery):
+    """
+    Number of rows of a (sliced) subquery
+    """
+    template = '(SELECT COUNT(*) FROM (%(subquery)s) _count)'
+    output_field = IntegerField()
+
+
+def count_limit():
+    return getattr(settings, 'API_UNREAD_COUNT_LIMIT', 1000)
+
+
+def latest_message(forum_id):
+    from .models import Message
+    return Subquery(Message.objects.filter(forum_id=forum_id).order_by('-id').values('id')[:1])
+
+
+def unread_counts(user_id):
+    """
+    Returns one dict per forum the user is a member of, with forum,
+    unread_count, unread_count_is_exact, last_read_message_id and
+    last_read_at. A single query whatever the number of forums.
+    """
+    from .models import ForumMembership, Message
+
+    limit = count_limit()
+    unread = Message.objects.filter(
+        forum_id=OuterRef('forum_id'), id__gt=OuterRef('last_read_message_id'),
+    ).order_by().values('id')[:limit + 1]
+    rows = (
+        ForumMembership.objects.filter(user_id=user_id, forum__is_deleted=False)
+        .annotate(unread=SubqueryCount(unread))
+        .order_by('joined_at', 'id')
+        .values('forum_id', 'unread', 'last_read_message_id', 'last_read_at')
+    )
+    return [
+        {
+            'forum': row['forum_id'],
+            'unread_count': min(row['unread'], limit),
+            'unread_count_is_exact': row['unread'] <= limit,
+            'last_read_message_id': row['last_read_message_id'],
+            'last_read_at': row['last_read_at'],
+        }
+        for row in rows
+    ]
+
+
+def mark_read(user_id, forum_id, message_id=None):
+    """
+    Moves the user's marker in the forum up to message_id, or to the
+    forum's latest message. Markers never move back, and message_id is
+    capped at the latest message so later posts can't count as read.
+    A single UPDATE on the (user, forum) key; returns whether it moved.
+    """
+    from .models import ForumMembership
+
+    latest = latest_message(forum_id)
+    target = latest if message_id is None else Least(message_id, latest)
+    return bool(
+        ForumMembership.objects.filter(user_id=user_id, forum_id=forum_id, last_read_message_id__lt=target)
+        .update(last_read_message_id=target, last_read_at=timezone.now())
+    )
+
+
+def initial_marker(forum_id):
+    """
+    Marker for someone joining the forum now: everything so far is read
+    """
+    from .models import Message
+    return Message.objects.filter(forum_id=forum_id).order_by('-id').values_list('id', flat=True).first() or 0
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from . import views
 from rest_framework.routers import DefaultRouter
@@ -7,9 +8,14 @@ router.register(r'forums', views.ForumViewSet, basename='forums')
 router.register(r'forum-memberships', views.ForumMembershipViewSet, basename='forum-memberships')
 router.register(r'messages', views.MessageViewSet, basename='messages')
 router.register(r'message-mentions', views.MessageMentionViewSet, basename='message-mentions')
+router.register(r'notifications', views.NotificationViewSet, basename='notifications')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('categories', views.CategoryList.as_view()),
     path('tags', views.TagList.as_view()),
-]
\ No newline at end of file
+    path('search/', views.SearchView.as_view(), name='search'),
+]
+if settings.API_ASYNC_VIEWS:
+    from . import asyncviews
+    urlpatterns = asyncviews.urlpatterns + urlpatterns
@@ -1,11 +1,24 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import CategorySerializer, TagSerializer, ForumSerializer, ForumMembershipSerializer, MessageSerializer, MessageMentionSerializer
-from .models import Category, Tag, Forum, ForumMembership, Message, MessageMention
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from .serializers import CategorySerializer, TagSerializer, ForumSerializer, ForumMembershipSerializer, MessageSerializer, MessageMentionSerializer, NotificationSerializer, ThreadMessageSerializer
+from .models import Category, Tag, Forum, ForumMembership, Message, MessageMention, Notification
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+from . import counters, facets, unread
+from .caching import cache_response
+from .conditional import ConditionalGetMixin
+from .fastpath import FastListMixin, ValuesPlan
+from .search import KINDS, get_backend
 from rest_framework.pagination import PageNumberPagination
+from .pagination import KeysetPagination
+from .planner import QueryPlannerMixin, plan_queryset
+from .streaming import StreamingListMixin, stream_format, streaming_response
+from .tree import subtree
 
 class CategoryList(APIView):
     """
@@ -13,10 +26,22 @@ class CategoryList(APIView):
     """
     permission_classes = []
     
+    @cache_response('categories', depends_on=['categories'])
     def get(self, request):
         categories = Category.objects.all()
+        fmt = stream_format(request)
+        if fmt:
+            return streaming_response(categories, CategorySerializer(context={'request': request}), fmt)
         serializer = CategorySerializer(categories, many=True)
         return Response(serializer.data)
+
+    def get_plan(self):
+        return ValuesPlan(CategorySerializer(), Category.objects.all())
+
+    @cache_response('categories', depends_on=['categories'])
+    async def aget(self, request):
+        plan = self.get_plan()
+        return Response(await plan.arender([row async for row in plan.values(Category.objects.all())]))
     
 class TagList(APIView):
     """
@@ -24,20 +49,68 @@ class TagList(APIView):
     """
     permission_classes = []
     
+    @cache_response('tags', depends_on=['tags'])
     def get(self, request):
         tags = Tag.objects.all()
+        fmt = stream_format(request)
+        if fmt:
+            return streaming_response(tags, TagSerializer(context={'request': request}), fmt)
         serializer = TagSerializer(tags, many=True)
         return Response(serializer.data)
+
+    def get_plan(self):
+        return ValuesPlan(TagSerializer(), Tag.objects.all())
+
+    @cache_response('tags', depends_on=['tags'])
+    async def aget(self, request):
+        plan = self.get_plan()
+        return Response(await plan.arender([row async for row in plan.values(Tag.objects.all())]))
+    
+
+class SearchView(APIView):
+    """
+    Full-text search over forum names/descriptions and message content.
+
+    ?q= is required; ?type=forum|message and ?forum_id= narrow the results,
+    ?limit= and ?offset= page through them. Hits are ranked best first.
+    """
+    permission_classes = []
+    max_limit = 100
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        kind = request.query_params.get('type')
+        if not query:
+            return Response({'q': 'This parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if kind and kind not in KINDS:
+            return Response({'type': f"Must be one of {', '.join(KINDS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            forum_id = int(request.query_params.get('forum_id') or 0) or None
+            limit = min(int(request.query_params.get('limit', 20)), self.max_limit)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({'detail': 'forum_id, limit and offset must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        hits = get_backend().search(query, kind=kind, forum_id=forum_id, limit=max(limit, 1), offset=offset)
+        return Response({'query': query, 'results': hits})
     
 
 class ForumPagination(PageNumberPagination):
     page_size = 10  # Default page size
     page_size_query_param = 'page_size'  # Allow client to override using query parameter
     max_page_size = 100  # Maximum allowed page size
-    
-    
-    
-class ForumViewSet(viewsets.ModelViewSet):
+
+
+class ForumCursorPagination(KeysetPagination):
+    """
+    Keyset pagination for forums when requested with ?cursor= or
+    ?pagination=cursor, page numbers otherwise
+    """
+    page_size = 10
+    fallback_class = ForumPagination
+
+
+class ForumViewSet(ConditionalGetMixin, FastListMixin, QueryPlannerMixin, viewsets.ModelViewSet):
     """
     A viewset that provides the standard actions for Forum:
     create, retrieve, update, partial_update, and destroy.
@@ -46,26 +119,60 @@ class ForumViewSet(viewsets.ModelViewSet):
     # Only show forums that are not marked as deleted
     queryset = Forum.objects.filter(is_deleted=False)
     permission_classes = [IsAuthenticatedOrReadOnly]
-    pagination_class = ForumPagination 
+    pagination_class = ForumCursorPagination
+    etag_max_fields = ('updated_at', 'last_activity_at')
+    etag_sum_fields = ('member_count', 'message_count')
+    etag_namespaces = ('categories', 'tags', 'users')
+    # ?ordering= options, all served by an index on the counter columns
+    orderings = {
+        'newest': ('-created_at', '-id'),
+        'most_active': ('-message_count', '-id'),
+        'most_members': ('-member_count', '-id'),
+        'recent_activity': ('-last_activity_at', '-id'),
+    }
+
     def get_queryset(self):
         queryset = Forum.objects.filter(is_deleted=False)
         category_id = self.request.query_params.get('category_id')
         tags_ids = self.request.query_params.getlist('tags_id')
-        user_id = self.request.query_params.get('user_id')
-        is_locked = self.request.query_params.get('is_locked')
 
         if category_id:
             queryset = queryset.filter(category_id=category_id)
         if tags_ids:
-            # This will return forums that have at least one of the specified tags.
-            queryset = queryset.filter(tags__id__in=tags_ids)
+            # Forums with any of the tags, or all of them with ?tags_mode=all.
+            # EXISTS doesn't multiply rows like joining the tags would, so
+            # there is nothing to .distinct() away.
+            links = Forum.tags.through.objects.filter(forum=OuterRef('pk'))
+            if self.request.query_params.get('tags_mode') == 'all':
+                for tag_id in tags_ids:
+                    queryset = queryset.filter(Exists(links.filter(tag_id=tag_id)))
+            else:
+                queryset = queryset.filter(Exists(links.filter(tag_id__in=tags_ids)))
+        queryset = queryset.filter(**self.unindexed_filters())
+
+        ordering = self.orderings.get(self.request.query_params.get('ordering'), self.orderings['newest'])
+        return queryset.order_by(*ordering)
+
+    def unindexed_filters(self):
+        """
+        The filters api.facets has no bitmaps for
+        """
+        filters = {}
+        user_id = self.request.query_params.get('user_id')
+        is_locked = self.request.query_params.get('is_locked')
         if user_id:
-            queryset = queryset.filter(created_by_id=user_id)
-            
+            filters['created_by_id'] = user_id
         if is_locked:
-            queryset = queryset.filter(is_locked=is_locked)
-        
-        return queryset.distinct().order_by('-created_at')
+            filters['is_locked'] = is_locked
+        return filters
+
+    @cache_response('forums', depends_on=['forums', 'categories', 'tags', 'users'])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response('forums', depends_on=['forums', 'categories', 'tags', 'users'])
+    async def alist(self, request, *args, **kwargs):
+        return await super().alist(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         # Set the current logged-in user as the creator.
@@ -75,14 +182,85 @@ class ForumViewSet(viewsets.ModelViewSet):
         # Instead of hard deletion, mark the forum as deleted.
         instance.is_deleted = True
         instance.save()
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def read(self, request, pk=None):
+        """
+        Marks the forum read for the current member, up to ?message_id= (or
+        "message_id" in the body) or its latest message. Does nothing for
+        non-members or markers that are already further.
+        """
+        message_id = request.data.get('message_id', request.query_params.get('message_id'))
+        try:
+            forum_id = int(pk)
+            message_id = int(message_id) if message_id not in (None, '') else None
+        except (TypeError, ValueError):
+            return Response({'message_id': 'Must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        unread.mark_read(request.user.pk, forum_id, message_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, url_path='facets')
+    def facets(self, request):
+        """
+        The forums list (same filters, ordering and pages) plus, under
+        "facets", how many forums match per category and per tag. Counts
+        come from the bitmaps in api.facets; category counts leave out
+        ?category_id= so they show where else the filters lead.
+        """
+        params = request.query_params
+        try:
+            category_id = int(params['category_id']) if params.get('category_id') else None
+        except ValueError:
+            return Response({'category_id': 'Must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            tag_ids = [int(tag_id) for tag_id in params.getlist('tags_id')]
+        except ValueError:
+            return Response({'tags_id': 'Must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        tags_mode = params.get('tags_mode', 'any')
+        if tags_mode not in ('any', 'all'):
+            return Response({'tags_mode': 'Must be "any" or "all"'}, status=status.HTTP_400_BAD_REQUEST)
+
+        within = None
+        filters = self.unindexed_filters()
+        if filters:
+            try:
+                ids = Forum.objects.filter(is_deleted=False, **filters).values_list('id', flat=True)
+                within = facets.from_ids(ids)
+            except (ValueError, DjangoValidationError):
+                return Response({'detail': 'Invalid user_id or is_locked'}, status=status.HTTP_400_BAD_REQUEST)
+
+        total, category_counts, tag_counts = facets.counts(category_id, tag_ids, tags_mode == 'all', within)
+        # Plain list, without the response cache and ETags of list()
+        response = FastListMixin.list(self, request)
+        response.data['facets'] = {
+            'count': total,
+            'categories': self.facet_list(Category, category_counts),
+            'tags': self.facet_list(Tag, tag_counts),
+        }
+        return response
+
+    @staticmethod
+    def facet_list(model, counts):
+        names = dict(model.objects.filter(pk__in=counts).values_list('id', 'name'))
+        items = [
+            {'id': value_id, 'name': names[value_id], 'count': count}
+            for value_id, count in counts.items() if value_id in names
+        ]
+        return sorted(items, key=lambda item: (-item['count'], item['name']))
         
-class ForumMembershipViewSet(viewsets.ModelViewSet):
+class ForumMembershipViewSet(ConditionalGetMixin, StreamingListMixin, QueryPlannerMixin, viewsets.ModelViewSet):
     """
     A viewset that provides the standard actions for ForumMembership:
     create, retrieve, update, partial_update, and destroy.
     """
     serializer_class = ForumMembershipSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    etag_max_fields = ('joined_at',)
+    # Read markers only move forward
+    etag_sum_fields = ('last_read_message_id',)
+    etag_namespaces = ('users',)
+    last_modified_field = 'joined_at'
     
     def get_queryset(self):
         """
@@ -99,15 +277,40 @@ class ForumMembershipViewSet(viewsets.ModelViewSet):
         if forum_id:
             queryset = queryset.filter(forum_id=forum_id)
             
-        return queryset
+        return queryset.order_by('joined_at', 'id')
     
+    @transaction.atomic
     def perform_create(self, serializer):
         """
         Ensure the user creating membership is assigned correctly
         """
-        serializer.save(user = self.request.user)
+        forum = serializer.validated_data['forum']
+        membership = serializer.save(user = self.request.user, last_read_message_id=unread.initial_marker(forum.pk))
+        counters.change_member_count(membership.forum_id, 1)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_forum_id = serializer.instance.forum_id
+        membership = serializer.save()
+        if membership.forum_id != old_forum_id:
+            counters.change_member_count(old_forum_id, -1)
+            counters.change_member_count(membership.forum_id, 1)
+            membership.last_read_message_id = unread.initial_marker(membership.forum_id)
+            membership.save(update_fields=['last_read_message_id'])
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        counters.change_member_count(instance.forum_id, -1)
+
+    @action(detail=False, methods=['get'], url_path='unread', permission_classes=[IsAuthenticated])
+    def unread_counts(self, request):
+        """
+        Unread message counts in each of the current user's forums
+        """
+        return Response(unread.unread_counts(request.user.pk))
         
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(ConditionalGetMixin, StreamingListMixin, FastListMixin, QueryPlannerMixin, viewsets.ModelViewSet):
     """
     A viewsets that provides the standard actions for Message:
     create, retrieve, update, partial_update, and destroy.
@@ -115,6 +318,9 @@ class MessageViewSet(viewsets.ModelViewSet):
     
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    # Moving a thread rewrites depths without touching updated_at
+    etag_sum_fields = ('depth',)
     
     def get_queryset(self):
         queryset = Message.objects.all()
@@ -130,18 +336,65 @@ class MessageViewSet(viewsets.ModelViewSet):
         if forum_id:
             queryset = queryset.filter(forum_id=forum_id)
             
-        return queryset.order_by('-created_at')
+        return queryset.order_by('-created_at', '-id')
     
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user = self.request.user)
+        message = serializer.save(user = self.request.user)
+        counters.change_message_count(message.forum_id, 1, message.created_at)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_forum_id = serializer.instance.forum_id
+        message = serializer.save()
+        if message.forum_id != old_forum_id:
+            counters.change_message_count(old_forum_id, -1)
+            counters.change_message_count(message.forum_id, 1, message.created_at)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # Replies are deleted along with the message
+        removed = Message.objects.filter(subtree(instance.path)).count()
+        instance.delete()
+        counters.change_message_count(instance.forum_id, -removed)
+
+    @action(detail=True, methods=['get'], serializer_class=ThreadMessageSerializer)
+    def thread(self, request, pk=None):
+        """
+        Returns a message and its replies in depth-first order, each with its
+        depth and reply count. ?max_depth=N limits how many levels below the
+        message are included; ?pagination=cursor pages through large threads.
+        """
+        root = self.get_object()
+        queryset = Message.objects.filter(subtree(root.path))
+
+        max_depth = request.query_params.get('max_depth')
+        if max_depth is not None:
+            try:
+                max_depth = int(max_depth)
+            except ValueError:
+                return Response({'max_depth': 'Must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(depth__lte=root.depth + max_depth)
+
+        queryset = plan_queryset(
+            queryset.annotate(reply_count=Count('replies')).order_by('path'),
+            self.get_serializer(),
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
         
-class MessageMentionViewSet(viewsets.ModelViewSet):
+class MessageMentionViewSet(ConditionalGetMixin, QueryPlannerMixin, viewsets.ModelViewSet):
     """
     A viewset that provides the standard actions for MessageMention:
     create, retrieve, update, partial_update, and destroy.
     """
     serializer_class = MessageMentionSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    etag_max_fields = ()
+    last_modified_field = None
     
     def get_queryset(self):
         queryset = MessageMention.objects.all()
@@ -151,8 +404,58 @@ class MessageMentionViewSet(viewsets.ModelViewSet):
         # if user_id:
         #     queryset = queryset.filter(mentioned_user_id=user_id)
         
-        queryset = queryset.filter(mentioned_user=self.request.user)
+        queryset = queryset.filter(mentioned_user_id=self.request.user.pk)
         if message_id:
             queryset = queryset.filter(message_id=message_id)
             
-        return queryset
\ No newline at end of file
+        return queryset.order_by('-id')
+
+
+class NotificationPagination(KeysetPagination):
+    """
+    Always keyset: inboxes only grow
+    """
+
+    def wants_keyset(self, request):
+        return True
+
+
+class NotificationViewSet(FastListMixin, QueryPlannerMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    The current user's notifications, newest first. ?unread=true lists
+    only the unread ones.
+    """
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = NotificationPagination
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(user_id=self.request.user.pk)
+        if self.request.query_params.get('unread') in ('1', 'true', 'True'):
+            queryset = queryset.filter(is_read=False)
+        return queryset.order_by('-id')
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        count = Notification.objects.filter(user_id=request.user.pk, is_read=False).count()
+        return Response({'unread_count': count})
+
+    @action(detail=False, methods=['post'])
+    def mark_read(self, request):
+        """
+        Marks the notifications listed in "ids" read, or all of them up to
+        the id "up_to", or all of them when neither is given
+        """
+        queryset = Notification.objects.filter(user_id=request.user.pk, is_read=False)
+        data = request.data
+        try:
+            if 'ids' in data:
+                ids = data.getlist('ids') if hasattr(data, 'getlist') else data['ids']
+                if not isinstance(ids, list):
+                    raise TypeError
+                queryset = queryset.filter(id__in=[int(value) for value in ids])
+            elif data.get('up_to') not in (None, ''):
+                queryset = queryset.filter(id__lte=int(data['up_to']))
+        except (TypeError, ValueError):
+            return Response({'detail': 'ids must be a list of integers and up_to an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'updated': queryset.update(is_read=True)})
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import LazyObject, empty
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .tokens import USER_CLAIMS
+
+CACHE_PREFIX = 'myauth:user:'
+
+
+def cache_timeout():
+    """
+    Seconds to keep loaded users in the cache; 0 disables caching
+    """
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+
+def get_user(user_id):
+    """
+    Loads a user, from the cache when possible. Returns None if there is
+    no such user.
+    """
+    timeout = cache_timeout()
+    key = f'{CACHE_PREFIX}{user_id}'
+    if timeout:
+        user = cache.get(key)
+        if user is not None:
+            return user
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if user is not None and timeout:
+        cache.set(key, user, timeout)
+    return user
+
+
+def forget_user(user_id):
+    cache.delete(f'{CACHE_PREFIX}{user_id}')
+
+
+class LazyUser(LazyObject):
+    """
+    Stands in for a myauth.User: id, pk, the token's USER_CLAIMS and the
+    authentication flags come from the token, anything else (or using it
+    as a model instance, e.g. assigning it to a foreign key) loads the
+    real user first.
+    """
+
+    def __init__(self, user_id, claims):
+        super().__init__()
+        self.__dict__['_claims'] = {
+            'id': user_id,
+            'pk': user_id,
+            'is_authenticated': True,
+            'is_anonymous': False,
+            **claims,
+        }
+
+    def _setup(self):
+        user = get_user(self._claims['id'])
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        self._wrapped = user
+
+    def __getattr__(self, name):
+        claims = self.__dict__['_claims']
+        if self._wrapped is empty and name in claims:
+            return claims[name]
+        return super().__getattr__(name)
+
+    def __bool__(self):
+        return True
+
+    def __str__(self):
+        if self._wrapped is empty:
+            return self._claims.get('email') or str(self._claims['id'])
+        return str(self._wrapped)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request user query: request.user is
+    a LazyUser built from the access token.
+
+    Unlike JWTAuthentication, deactivated users keep access until their
+    access token expires, the is_staff claim is trusted for as long, and
+    tokens aren't checked against password changes. It is therefore not
+    the default: views opt in with authentication_classes, where serving
+    such a user until the token expires is acceptable.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        claims = {claim: validated_token[claim] for claim in USER_CLAIMS if claim in validated_token}
+        return LazyUser(user_id, claims)
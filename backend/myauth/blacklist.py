@@ -0,0 +1,103 @@
+"""
+Refresh token blacklist checks that don't grow with the blacklist.
+
+Each process keeps a Bloom filter of blacklisted token ids, loaded once
+from the unexpired rows of BlacklistedToken. Before answering, it picks up
+rows blacklisted since (by any process) with a primary key range query,
+which stays constant-time however big the table gets. A token not in the
+filter is certainly not blacklisted; filter hits are confirmed in the
+database, since Bloom filters have false positives.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+# Rows below the newest seen id that are re-read on every sync: with
+# concurrent transactions ids can become visible out of order
+SYNC_OVERLAP = 50
+
+
+class BloomFilter:
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        # Double hashing: k positions from two 64-bit halves
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, value):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self.positions(value))
+
+
+class Blacklist:
+
+    def __init__(self, capacity=None, error_rate=None, sync_interval=None):
+        self.capacity = capacity or getattr(settings, 'AUTH_BLACKLIST_CAPACITY', 1_000_000)
+        self.error_rate = error_rate or getattr(settings, 'AUTH_BLACKLIST_ERROR_RATE', 0.001)
+        self.sync_interval = sync_interval if sync_interval is not None else getattr(settings, 'AUTH_BLACKLIST_SYNC_SECONDS', 0)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.filter = None
+        self.last_id = 0
+        self.synced_at = 0
+
+    def load(self):
+        self.filter = BloomFilter(self.capacity, self.error_rate)
+        self.last_id = BlacklistedToken.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        jtis = (
+            BlacklistedToken.objects.filter(id__lte=self.last_id, token__expires_at__gt=timezone.now())
+            .values_list('token__jti', flat=True).iterator(chunk_size=10000)
+        )
+        for jti in jtis:
+            self.filter.add(jti)
+
+    def sync(self):
+        with self.lock:
+            if self.filter is None:
+                self.load()
+            elif time.monotonic() - self.synced_at >= self.sync_interval:
+                rows = (
+                    BlacklistedToken.objects.filter(id__gt=self.last_id - SYNC_OVERLAP)
+                    .order_by('id').values_list('id', 'token__jti')
+                )
+                for row_id, jti in rows:
+                    self.filter.add(jti)
+                    self.last_id = max(self.last_id, row_id)
+            else:
+                return
+            self.synced_at = time.monotonic()
+
+    def add(self, jti):
+        """
+        Makes a token this process just blacklisted count right away,
+        whatever the sync interval
+        """
+        with self.lock:
+            if self.filter is not None:
+                self.filter.add(jti)
+
+    def __contains__(self, jti):
+        self.sync()
+        if jti not in self.filter:
+            return False
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+blacklist = Blacklist()
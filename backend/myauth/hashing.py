@@ -0,0 +1,71 @@
+"""
+Password hashing on a small bounded pool of threads.
+
+PBKDF2 is deliberately slow. Run inline, a burst of logins keeps every
+request thread busy hashing and the rest of the api waits behind them.
+Here at most AUTH_HASHING_WORKERS hashes run at once (hashlib releases the
+GIL while hashing, so request threads keep running alongside), at most
+AUTH_HASHING_QUEUE more wait for a turn, and anything beyond that is
+turned away with a 503 right away instead of piling up.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins at the moment, try again in a few seconds.'
+    default_code = 'hashing_busy'
+
+
+class HashingPool:
+
+    def __init__(self, workers=None, queue=None):
+        self.workers = workers or getattr(settings, 'AUTH_HASHING_WORKERS', 2)
+        self.queue = queue if queue is not None else getattr(settings, 'AUTH_HASHING_QUEUE', 16)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hashing')
+        self.slots = threading.BoundedSemaphore(self.workers + self.queue)
+
+    def run(self, function, *args):
+        """
+        Runs function on the pool and returns its result, or raises
+        HashingBusy when every worker and queue slot is taken
+        """
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self.executor.submit(function, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future.result()
+
+
+pool = None
+pool_lock = threading.Lock()
+
+
+def get_pool():
+    global pool
+    with pool_lock:
+        if pool is None:
+            pool = HashingPool()
+        return pool
+
+
+def verify_password(password, encoded):
+    """
+    Returns (is_correct, must_update) like django's verify_password, the
+    second being True when the hash was made with other hasher settings
+    """
+    return get_pool().run(hashers.verify_password, password, encoded)
+
+
+def make_password(password):
+    return get_pool().run(hashers.make_password, password)
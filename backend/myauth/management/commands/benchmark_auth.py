@@ -0,0 +1,49 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from myauth.authentication import StatelessJWTAuthentication
+from myauth.models import User
+from myauth.tokens import ForumRefreshToken
+
+
+class Command(BaseCommand):
+    help = 'Measures per-request authentication time and queries for JWTAuthentication and StatelessJWTAuthentication. All writes are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        with transaction.atomic():
+            user = User.objects.create_user(email='bench-auth@example.com', password=None, name='bench_auth')
+            token = ForumRefreshToken.for_user(user).access_token
+            request = RequestFactory().get('/api/forums/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+            self.stdout.write(f"{'authentication':<28} {'us/request':>10} {'queries/request':>16}")
+            cases = [
+                ('JWTAuthentication', JWTAuthentication(), False),
+                ('Stateless (claims only)', StatelessJWTAuthentication(), False),
+                ('Stateless (user loaded)', StatelessJWTAuthentication(), True),
+            ]
+            for label, authenticator, load in cases:
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for _ in range(count):
+                        authenticated, _ = authenticator.authenticate(Request(request))
+                        if load:
+                            # Forces the (cached) full user, like a write would
+                            authenticated.date_joined
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{label:<28} {elapsed / count * 1e6:>10.1f} {len(queries) / count:>16.3f}'
+                )
+
+            transaction.set_rollback(True)
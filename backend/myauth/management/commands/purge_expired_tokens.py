@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired refresh tokens and their blacklist entries in small batches, so the tables stay small without long locks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('id')
+        last_id = 0
+        deleted = blacklisted = 0
+        while True:
+            ids = list(expired.filter(id__gt=last_id).values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            with transaction.atomic():
+                blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                deleted += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+            last_id = ids[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{deleted} tokens deleted')
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired tokens ({blacklisted} blacklisted)'))
@@ -27,7 +27,7 @@ class CustomUserManager(BaseUserManager):
     
 class User(AbstractUser):
     email = models.EmailField(unique=True)
-    name = models.CharField(max_length=255)  # Add this field
+    name = models.CharField(max_length=255, db_index=True)  # Indexed for @mention lookups
     username = None
 
     USERNAME_FIELD = 'email'
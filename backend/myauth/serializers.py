@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from . import hashing
 from .models import User
 
 class UserSerializer(serializers.ModelSerializer):
@@ -11,7 +12,12 @@ class UserSerializer(serializers.ModelSerializer):
         }
 
     def create(self, validated_data):
-        return User.objects.create_user(**validated_data)
+        # Hashed on the bounded pool rather than by create_user on this thread
+        password = hashing.make_password(validated_data.pop('password'))
+        email = User.objects.normalize_email(validated_data.pop('email'))
+        user = User(email=email, password=password, **validated_data)
+        user.save()
+        return user
     
 class NestedUserSerializer(serializers.ModelSerializer):
     class Meta:
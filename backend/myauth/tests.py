@@ -1,3 +1,212 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from api.models import Forum, Message
+from .authentication import StatelessJWTAuthentication
+from .blacklist import BloomFilter, blacklist
+from .hashing import HashingBusy, HashingPool
+from .models import User
+from .throttles import LoginEmailThrottle, LoginIPThrottle
+from .tokens import ForumRefreshToken
+
+
+class StatelessAuthenticationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='author@example.com', password='secret', name='author')
+        cls.token = ForumRefreshToken.for_user(cls.user).access_token
+
+    def setUp(self):
+        cache.clear()
+
+    def authenticate(self):
+        request = RequestFactory().get('/api/forums/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        user, _ = StatelessJWTAuthentication().authenticate(Request(request))
+        return user
+
+    def test_claims_need_no_query(self):
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            self.assertTrue(user and user.is_authenticated)
+            self.assertEqual((user.pk, user.name, user.email, user.is_staff), (self.user.pk, 'author', 'author@example.com', False))
+
+    def test_full_user_is_loaded_once_and_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().date_joined, self.user.date_joined)
+        with self.assertNumQueries(0):
+            self.assertTrue(isinstance(self.authenticate(), User))
+
+        self.user.name = 'renamed'
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().get_full_name(), '')
+
+    def test_login_token_works_for_writes(self):
+        client = APIClient()
+        login = client.post('/auth/login', {'email': 'author@example.com', 'password': 'secret'}).data
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {login['tokens']['access']}")
+        forum = Forum.objects.create(name='General', created_by=self.user)
+        response = client.post('/api/messages/', {'forum': forum.pk, 'content': 'hello'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Message.objects.get().user, self.user)
+
+
+    def test_default_authentication_checks_the_user(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(client.get('/api/forum-memberships/unread/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(client.get('/api/forum-memberships/unread/').status_code, 401)
+
+
+class BlacklistTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='author@example.com', password='secret', name='author')
+
+    def setUp(self):
+        cache.clear()
+        blacklist.reset()
+        self.client = APIClient()
+        self.tokens = self.client.post('/auth/login', {'email': 'author@example.com', 'password': 'secret'}).data['tokens']
+
+    def refresh(self):
+        return self.client.post('/auth/token/refresh', {'refresh': self.tokens['refresh']})
+
+    def test_refresh_until_logout(self):
+        response = self.refresh()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+        response = self.client.post('/auth/logout', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 205)
+        self.assertEqual(self.refresh().status_code, 401)
+        response = self.client.post('/auth/logout', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 400)
+
+    def test_blacklisted_elsewhere(self):
+        self.refresh()
+        # Another process blacklisted it: only the database knows
+        jti = ForumRefreshToken(self.tokens['refresh'])['jti']
+        token = OutstandingToken.objects.get(jti=jti)
+        BlacklistedToken.objects.create(token=token)
+        self.assertEqual(self.refresh().status_code, 401)
+
+    def test_check_without_blacklist_lookup(self):
+        for index in range(3):
+            other = ForumRefreshToken.for_user(self.user)
+            other.blacklist()
+        self.refresh()
+        token = ForumRefreshToken(self.tokens['refresh'], verify=False)
+        # Only the new rows since the last sync, never a jti lookup
+        with self.assertNumQueries(1):
+            token.check_blacklist()
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        values = [f'jti-{index}' for index in range(1000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+        false_positives = sum(f'other-{index}' in bloom for index in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_purge_expired_tokens(self):
+        expired = ForumRefreshToken.for_user(self.user)
+        expired.blacklist()
+        OutstandingToken.objects.filter(jti=expired['jti']).update(expires_at=timezone.now() - timedelta(days=1))
+
+        out = StringIO()
+        call_command('purge_expired_tokens', batch_size=1, stdout=out)
+        self.assertIn('Deleted 1 expired tokens (1 blacklisted)', out.getvalue())
+        self.assertFalse(OutstandingToken.objects.filter(jti=expired['jti']).exists())
+        self.assertEqual(self.refresh().status_code, 200)
+
+
+class LoginControlTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='author@example.com', password='secret', name='author')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def login(self, email='author@example.com', password='secret'):
+        return self.client.post('/auth/login', {'email': email, 'password': password})
+
+    def test_register_then_login(self):
+        response = self.client.post('/auth/register', {'email': 'New@Example.com', 'name': 'new', 'password': 'pw12345'})
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(name='new')
+        self.assertEqual(user.email, 'New@example.com')
+        self.assertTrue(user.check_password('pw12345'))
+        self.assertEqual(self.login('New@example.com', 'pw12345').status_code, 200)
+        self.assertEqual(self.login('New@example.com', 'wrong').status_code, 400)
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ])
+    def test_rehash_on_login(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_password('secret', hasher='md5'))
+        self.assertEqual(self.login(password='wrong').status_code, 400)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('md5$'))
+
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(self.login().status_code, 200)
+
+    @mock.patch.object(LoginEmailThrottle, 'rate', '2/min', create=True)
+    def test_email_throttle(self):
+        self.assertEqual(self.login(password='wrong').status_code, 400)
+        self.assertEqual(self.login(password='wrong').status_code, 400)
+        self.assertEqual(self.login().status_code, 429)
+        self.assertEqual(self.login(email=' AUTHOR@example.com').status_code, 429)
+        self.assertEqual(self.login(email='other@example.com').status_code, 400)
+
+    @mock.patch.object(LoginIPThrottle, 'rate', '3/min', create=True)
+    def test_ip_throttle(self):
+        for number in range(3):
+            self.assertEqual(self.login(email=f'user{number}@example.com').status_code, 400)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_busy_pool_turns_work_away(self):
+        pool = HashingPool(workers=1, queue=0)
+        started, release = threading.Event(), threading.Event()
+
+        def hold():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=pool.run, args=(hold,))
+        thread.start()
+        started.wait(5)
+        with self.assertRaises(HashingBusy):
+            pool.run(len, 'x')
+        release.set()
+        thread.join()
+        self.assertEqual(pool.run(len, 'x'), 1)
+
+        with mock.patch('myauth.hashing.get_pool', return_value=mock.Mock(run=mock.Mock(side_effect=HashingBusy))):
+            self.assertEqual(self.login().status_code, 503)
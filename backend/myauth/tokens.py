@@ -0,0 +1,38 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .blacklist import blacklist
+
+# User fields copied into tokens, so StatelessJWTAuthentication can answer
+# most questions about the user without loading it
+USER_CLAIMS = ('name', 'email', 'is_staff')
+
+
+class ForumRefreshToken(RefreshToken):
+    """
+    Refresh token whose access tokens carry the USER_CLAIMS, checked
+    against the in-memory blacklist filter (see myauth.blacklist)
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+    def check_blacklist(self):
+        if self.payload[api_settings.JTI_CLAIM] in blacklist:
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist.add(self.payload[api_settings.JTI_CLAIM])
+        return result
+
+
+class ForumTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ForumRefreshToken
@@ -6,5 +6,6 @@ urlpatterns = [
     path('register', views.RegistrationView.as_view(), name='register'),
     path('login', views.LoginView.as_view(), name='login'),
     path('logout', views.LogoutView.as_view(), name='logout'),
+    path('token/refresh', views.RefreshView.as_view(), name='token_refresh'),
     path("hello", views.HelloView.as_view(), name="hello"),
 ]
\ No newline at end of file
@@ -5,14 +5,17 @@ from django.middleware.csrf import get_token
 from django.conf import settings
 from .serializers import UserSerializer
 from .models import User
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
+from .tokens import ForumRefreshToken, ForumTokenRefreshSerializer
 from rest_framework.permissions import IsAuthenticated
+from . import hashing
+from .throttles import LoginEmailThrottle, LoginIPThrottle
 
 def get_tokens_for_user(user):
     """
     Generate refresh and access tokens for a user.
     """
-    refresh = RefreshToken.for_user(user)
+    refresh = ForumRefreshToken.for_user(user)
     return {
         'refresh': str(refresh),
         'access': str(refresh.access_token),
@@ -55,6 +58,7 @@ class LoginView(APIView):
     """
     
     permission_classes = []
+    throttle_classes = [LoginIPThrottle, LoginEmailThrottle]
     
     def post(self, request, *args, **kwargs):
         data = request.data
@@ -63,8 +67,13 @@ class LoginView(APIView):
         
         try:
             user = User.objects.get(email=email)
-            if not user.check_password(password):
+            is_correct, must_update = hashing.verify_password(password, user.password)
+            if not is_correct:
                 return Response({"error": "Invalid password"}, status=status.HTTP_400_BAD_REQUEST)
+            if must_update:
+                # Hashed with older hasher settings: store it the current way
+                user.password = hashing.make_password(password)
+                user.save(update_fields=['password'])
             
             tokens = get_tokens_for_user(user)
             user_data = UserSerializer(user).data
@@ -95,8 +104,15 @@ class LogoutView(APIView):
         if not refresh_token:
             return Response({"error": "Refresh token is required"}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            token = RefreshToken(refresh_token)
+            token = ForumRefreshToken(refresh_token)
             token.blacklist()  # Blacklist the refresh token
             return Response({"success": "Logged out successfully"}, status=status.HTTP_205_RESET_CONTENT)
         except Exception as e:
             return Response({"error": "Invalid or already blacklisted token"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class RefreshView(TokenRefreshView):
+    """
+    Returns a new access token for a refresh token that isn't blacklisted
+    """
+    serializer_class = ForumTokenRefreshSerializer
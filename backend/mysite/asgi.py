@@ -12,5 +12,28 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+# Native async views for the hot read endpoints (API_ASYNC_VIEWS=0 to compare)
+os.environ.setdefault('API_ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up
+from api.consumers import EventsConsumer  # noqa: E402
+
+websocket_routes = {
+    '/ws/events/': EventsConsumer(),
+}
+
+
+async def application(scope, receive, send):
+    """
+    Sends WebSocket connections to their consumer and everything else to Django
+    """
+    if scope['type'] == 'websocket':
+        consumer = websocket_routes.get(scope['path'])
+        if consumer is None:
+            await receive()
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+        return await consumer(scope, receive, send)
+    return await django_application(scope, receive, send)
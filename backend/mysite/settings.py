@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import databases_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it times everything below (see api/metrics.py)
+    'api.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -54,6 +59,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.replicas.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'mysite.urls'
@@ -102,11 +108,20 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        # Loads the user on every request, so deactivated users and revoked
+        # staff flags take effect at once. Views can opt in to
+        # myauth.authentication.StatelessJWTAuthentication instead, which
+        # trusts the token claims until the token expires
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    # Login attempts, see myauth/throttles.py
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',
+        'login_email': '10/min',
+    },
 }
 
 from datetime import timedelta
@@ -120,17 +135,113 @@ SIMPLE_JWT = {
 
 AUTH_USER_MODEL = 'myauth.User'  # Adjust based on your app name
 
+# Seconds users loaded by StatelessJWTAuthentication (for views using it)
+# stay cached (0 disables)
+AUTH_USER_CACHE_TIMEOUT = 60
+
+# Refresh token blacklist filter kept by each process (see myauth.blacklist):
+# expected number of unexpired blacklisted tokens, the false positive rate
+# and the seconds between checks for tokens blacklisted by other processes
+AUTH_BLACKLIST_CAPACITY = 1_000_000
+AUTH_BLACKLIST_ERROR_RATE = 0.001
+AUTH_BLACKLIST_SYNC_SECONDS = 0
+
+# Password hashes computed at once by each process (see myauth/hashing.py),
+# and how many more may wait before logins get a 503
+AUTH_HASHING_WORKERS = 2
+AUTH_HASHING_QUEUE = 16
+
+# Seconds to cache @mention name -> user id lookups (0 disables the cache)
+API_MENTION_CACHE_TIMEOUT = 300
+
+# Full-text search backend for /api/search/. None picks SQLite FTS5 or
+# Postgres tsvector from the database vendor (see api/search.py)
+API_SEARCH_BACKEND = None
+
+# Broker for WebSocket events (/ws/events/ under ASGI). The in-process broker
+# only reaches clients connected to the same process; use
+# 'api.realtime.RedisBroker' with {'url': 'redis://...'} for several workers
+API_REALTIME_BROKER = 'api.realtime.InProcessBroker'
+API_REALTIME_BROKER_OPTIONS = {}
+
+# Rows fetched and rendered per chunk by ?stream=json|ndjson list responses
+API_STREAM_CHUNK_SIZE = 500
+
+# Render forum and message lists straight from .values() rows instead of
+# through the DRF serializers (same output, see api/fastpath.py)
+API_FAST_SERIALIZERS = True
+
+# Side effects of writes (mentions, notifications, search indexing) are
+# queued as jobs and run by `manage.py run_jobs` (see api/jobs.py). Eager
+# runs them inline instead. None picks eager while API_REALTIME_BROKER is
+# in-process, since the events of jobs run by a worker wouldn't reach the
+# websockets, and the queue with a shared broker. Failed jobs are retried
+# after RETRY_DELAY seconds, doubling up to MAX_RETRY_DELAY
+API_JOBS_EAGER = None
+API_JOBS_RETRY_DELAY = 5
+API_JOBS_MAX_RETRY_DELAY = 3600
+
+# Unread counts per forum stop at this many (see api/unread.py)
+API_UNREAD_COUNT_LIMIT = 1000
+
+# Request metrics (see api/metrics.py): the bearer token scrapers of
+# /metrics must send, or else the addresses allowed to read it (only
+# meaningful without a reverse proxy in front; empty denies everyone), the
+# share of requests whose queries, serialization and rendering are measured
+# too, whether responses carry a Server-Timing header, and the duration over
+# which sampled requests are logged to api.slow with their slowest queries
+# (None turns the slow log off)
+API_METRICS_TOKEN = os.environ.get('API_METRICS_TOKEN') or None
+API_METRICS_ALLOWED_IPS = []
+API_METRICS_SAMPLE_RATE = 0.1
+API_SERVER_TIMING = True
+API_SLOW_REQUEST_SECONDS = None
+
+# Serve the hot read endpoints with the async views of api/asyncviews.py.
+# mysite/asgi.py turns this on: under WSGI every async view would need an
+# event loop of its own
+API_ASYNC_VIEWS = os.environ.get('API_ASYNC_VIEWS', '') in ('1', 'true', 'yes')
+
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory is per process; point 'default' at Redis or Memcached to share
+# cached responses and invalidations between workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'forum-api',
+    }
+}
+
+# Response cache for the hottest list endpoints (see api/caching.py).
+# Saves invalidate the lists; counters in the forum list may lag by up to
+# the forums TTL.
+API_CACHE_ALIAS = 'default'
+API_CACHE_TTLS = {
+    'categories': 60 * 60,
+    'tags': 60 * 60,
+    'forums': 30,
+}
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# SQLite by default; set DATABASE_URL (and DATABASE_REPLICA_URLS for read
+# replicas) to use PostgreSQL, see mysite/database.py for all variables
+
+DATABASES, API_READ_REPLICAS = databases_from_env({
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db.sqlite3',
+})
+
+# GET requests to the api read from API_READ_REPLICAS, everything else and
+# requests right after a write from the primary (see api/replicas.py)
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+API_REPLICA_PIN_SECONDS = 5
 
 
 # Password validation
@@ -18,8 +18,11 @@ from django.contrib import admin
 from django.urls import path
 from django.urls.conf import include
 
+from api.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('myauth.urls')),
     path('api/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]